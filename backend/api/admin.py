@@ -1,8 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 
+from . import shopping_list
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -59,6 +61,23 @@ class RecipeAdmin(admin.ModelAdmin):
 
     get_favorite_count.short_description = 'Количество в избранном'
 
+    @transaction.atomic
+    def save_related(self, request, form, formsets, change):
+        """
+        Сохраняет ингредиенты рецепта и переносит изменения их количества
+        в списки покупок пользователей.
+        """
+        shopping_list.lock_recipe(form.instance.pk)
+        before = shopping_list.get_recipe_amounts(form.instance.pk)
+        super().save_related(request, form, formsets, change)
+        after = shopping_list.get_recipe_amounts(form.instance.pk)
+        shopping_list.recipe_ingredients_changed(form.instance.pk, {
+            ingredient_id: after.get(ingredient_id, 0)
+            - before.get(ingredient_id, 0)
+            for ingredient_id in before.keys() | after.keys()
+            if after.get(ingredient_id, 0) != before.get(ingredient_id, 0)
+        })
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -92,7 +111,57 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     """
-    Кастомная админка для модели ShoppingCart.
+    Кастомная админка для модели ShoppingCart, поддерживающая
+    согласованность агрегированных списков покупок.
     """
 
     list_display = ('user', 'recipe')
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        """
+        Сохраняет позицию корзины и обновляет список покупок.
+        """
+        if change:
+            old = ShoppingCart.objects.get(pk=obj.pk)
+            shopping_list.remove_recipe(old.user_id, old.recipe_id)
+        super().save_model(request, obj, form, change)
+        shopping_list.add_recipe(obj.user_id, obj.recipe_id)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        """
+        Удаляет позицию корзины и обновляет список покупок.
+        """
+        shopping_list.remove_recipe(obj.user_id, obj.recipe_id)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        """
+        Удаляет выбранные позиции корзины и обновляет списки покупок.
+        """
+        for user_id, recipe_id in queryset.values_list('user_id',
+                                                       'recipe_id'):
+            shopping_list.remove_recipe(user_id, recipe_id)
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """
+    Админка агрегированных списков покупок только для просмотра:
+    они вычисляются по корзинам (см. api.shopping_list) и пересобираются
+    командой rebuild_shopping_lists.
+    """
+
+    list_display = ('user', 'ingredient', 'amount')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
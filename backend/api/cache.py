@@ -0,0 +1,165 @@
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .constants import (DATA_VERSION_CHECK_INTERVAL, RECIPE_CACHE_TIMEOUT,
+                        RECIPE_CACHE_VERSION)
+from .metrics import metrics
+from .models import DataVersion
+
+
+# Последняя прочитанная из БД версия: {имя: (время проверки, версия)}.
+_checked_versions = {}
+
+
+def get_data_version(name):
+    """
+    Возвращает версию набора данных name — пару (счётчик изменений,
+    время последнего изменения в секундах). Версия хранится в БД,
+    поэтому одинакова для всех процессов независимо от бэкенда кэша.
+
+    БД опрашивается не чаще раза в DATA_VERSION_CHECK_INTERVAL секунд:
+    изменения из других процессов становятся видны с этой задержкой,
+    изменения текущего процесса — сразу после фиксации транзакции.
+    """
+    checked = _checked_versions.get(name)
+    if (checked is not None
+            and time.monotonic() - checked[0] < DATA_VERSION_CHECK_INTERVAL):
+        return checked[1]
+    version = DataVersion.objects.filter(name=name).values_list(
+        'version', 'updated').first()
+    if version is None:
+        data_version, _ = DataVersion.objects.get_or_create(name=name)
+        version = (data_version.version, data_version.updated)
+    version = version[0], version[1].timestamp()
+    _checked_versions[name] = (time.monotonic(), version)
+    return version
+
+
+def bump_data_version(name):
+    """
+    Отмечает изменение набора данных name. Вызывается в транзакции,
+    изменяющей данные, и фиксируется вместе с ней.
+    """
+    updated = DataVersion.objects.filter(name=name).update(
+        version=F('version') + 1, updated=timezone.now())
+    if not updated:
+        DataVersion.objects.get_or_create(name=name)
+    transaction.on_commit(lambda: _checked_versions.pop(name, None))
+
+
+def recipe_cache_key(recipe_id, generation):
+    """
+    Возвращает ключ кэша для не зависящей от пользователя части рецепта.
+    """
+    return f'recipe:{RECIPE_CACHE_VERSION}:{recipe_id}:{generation}'
+
+
+def author_cache_key(author_id, generation):
+    """
+    Возвращает ключ кэша для данных автора рецепта.
+    """
+    return f'author:{RECIPE_CACHE_VERSION}:{author_id}:{generation}'
+
+
+def generation_key(name, pk):
+    return f'{name}-generation:{pk}'
+
+
+def get_generations(name, ids):
+    """
+    Возвращает словарь {id: поколение} для фрагментов name. Поколение
+    входит в ключ фрагмента и меняется при сбросе кэша, поэтому
+    фрагмент, построенный до изменения данных и сохранённый после
+    сброса, попадает под старый ключ и больше не читается.
+
+    Отсутствующие поколения создаются до чтения данных из БД: сброс,
+    случившийся после этого, заменит их новыми.
+    """
+    keys = {generation_key(name, pk): pk for pk in ids}
+    generations = cache.get_many(list(keys))
+    missing = {key: uuid.uuid4().hex for key in keys
+               if key not in generations}
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return {keys[key]: generation for key, generation in generations.items()}
+
+
+def _get_many(name, key_func, generations):
+    keys = {key_func(pk, generation): pk
+            for pk, generation in generations.items()}
+    found = {keys[key]: value
+             for key, value in cache.get_many(list(keys)).items()}
+    metrics.record_cache(name, len(found), len(keys) - len(found))
+    return found
+
+
+def _set_many(key_func, generations, fragments):
+    cache.set_many(
+        {key_func(pk, generations[pk]): value
+         for pk, value in fragments.items()},
+        RECIPE_CACHE_TIMEOUT)
+
+
+def _invalidate(name, ids):
+    cache.set_many({generation_key(name, pk): uuid.uuid4().hex
+                    for pk in ids}, None)
+
+
+def get_recipe_fragments(generations):
+    """
+    Возвращает словарь {id рецепта: фрагмент} для найденных в кэше
+    рецептов. generations — результат get_generations('recipe', ...).
+    """
+    return _get_many('recipe', recipe_cache_key, generations)
+
+
+def set_recipe_fragments(generations, fragments):
+    """
+    Сохраняет фрагменты рецептов в кэш под поколениями generations,
+    прочитанными до построения фрагментов.
+    """
+    _set_many(recipe_cache_key, generations, fragments)
+
+
+def get_author_fragments(generations):
+    """
+    Возвращает словарь {id автора: фрагмент} для найденных в кэше авторов.
+    """
+    return _get_many('author', author_cache_key, generations)
+
+
+def set_author_fragments(generations, fragments):
+    """
+    Сохраняет фрагменты авторов в кэш под поколениями generations.
+    """
+    _set_many(author_cache_key, generations, fragments)
+
+
+def invalidate_recipes(recipe_ids):
+    """
+    Сбрасывает кэш рецептов, меняя их поколения.
+    """
+    _invalidate('recipe', recipe_ids)
+
+
+def invalidate_authors(author_ids):
+    """
+    Сбрасывает кэш авторов, меняя их поколения.
+    """
+    _invalidate('author', author_ids)
+
+
+def invalidate_recipes_on_commit(recipe_ids):
+    """
+    Сбрасывает кэш рецептов после фиксации транзакции, чтобы параллельный
+    запрос не успел закэшировать незафиксированное состояние.
+    """
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: invalidate_recipes(recipe_ids))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Кэш фрагментов рецептов и коротких ссылок сбрасывается в процессе,
+    изменившем данные. С кэшем в памяти процесса остальные воркеры
+    этого не видят и отдают устаревшие данные до истечения таймаута.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        f'Кэш {backend} не общий для процессов: воркеры будут отдавать '
+        'устаревшие рецепты после изменений в других процессах.',
+        hint='Укажите общий кэш в CACHE_BACKEND и CACHE_LOCATION, '
+             'например django.core.cache.backends.memcached.'
+             'PyMemcacheCache и memcached:11211.',
+        id='api.W001')]
@@ -8,5 +8,40 @@ INGREDIENT_UNIT_LENGTH = 64
 
 RECIPE_NAME_LENGTH = 256
 RECIPE_CODE_LENGTH = 8
+SHORT_CODE_ATTEMPTS = 5
 
 AMOUNT_MIN_VALUE = 1
+
+RECIPE_CACHE_VERSION = 2
+RECIPE_CACHE_TIMEOUT = 60 * 5
+
+INGREDIENT_INDEX_TTL = 60 * 5
+
+INGREDIENTS_VERSION = 'ingredients'
+TAGS_VERSION = 'tags'
+DATA_VERSION_CHECK_INTERVAL = 5
+REFERENCE_DATA_MAX_AGE = 60
+REFERENCE_SNAPSHOT_TTL = 60 * 5
+
+SEARCH_CONFIG = 'russian'
+
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+IMAGE_VARIANT_QUALITY = 85
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_DIMENSION = 2560
+# JPEG декодируется сразу уменьшенным (Image.draft), остальные форматы
+# перед уменьшением декодируются целиком, поэтому их предел меньше.
+IMAGE_MAX_PIXELS = 4 * IMAGE_MAX_DIMENSION ** 2
+IMAGE_MAX_DECODED_PIXELS = IMAGE_MAX_DIMENSION ** 2
+IMAGE_UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif',
+                        'WEBP': 'webp'}
+RELEASE_GRACE_PERIOD = 10 * 60
+
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+SHORT_LINK_NEGATIVE_TIMEOUT = 30
+SHORT_LINK_LOCAL_TIMEOUT = 60
+SHORT_LINK_LRU_SIZE = 10_000
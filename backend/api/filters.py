@@ -1,15 +1,62 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Q
 from django_filters.rest_framework import FilterSet, filters
 
-from .models import Ingredient, Recipe, Tag
+from .constants import SEARCH_CONFIG
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
 
 User = get_user_model()
 
 
+def filter_by_similarity(queryset, field_name, value):
+    """
+    Нечёткий поиск по полю field_name. В PostgreSQL использует
+    триграммы pg_trgm (поиск устойчив к опечаткам, результаты
+    упорядочены по сходству, запрос обслуживается GIN-индексом),
+    на остальных СУБД — поиск по вхождению подстроки.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(**{f'{field_name}__icontains': value})
+    return queryset.filter(
+        Q(**{f'{field_name}__icontains': value})
+        | Q(**{f'{field_name}__trigram_similar': value})
+    ).annotate(
+        similarity=TrigramSimilarity(field_name, value)
+    ).order_by('-similarity', field_name)
+
+
+def search_recipes(queryset, value):
+    """
+    Полнотекстовый поиск рецептов по названию, описанию и названиям
+    ингредиентов. В PostgreSQL использует сохранённый поисковый вектор
+    и ранжирует результаты по SearchRank; названия с опечатками
+    находятся по триграммам. На остальных СУБД — поиск по вхождению.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(
+            Q(name__icontains=value)
+            | Q(text__icontains=value)
+            | Exists(RecipeIngredient.objects.filter(
+                recipe_id=OuterRef('pk'),
+                ingredient__name__icontains=value))
+        )
+    query = SearchQuery(value, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(search_vector=query) | Q(name__trigram_similar=value)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), query),
+        similarity=TrigramSimilarity('name', value),
+    ).order_by('-rank', '-similarity', '-id')
+
+
 class RecipeFilter(FilterSet):
     """
     Фильтр для рецептов, позволяющий фильтровать по автору, тегам,
-    добавлению в избранное и наличию в корзине покупок.
+    добавлению в избранное и наличию в корзине покупок,
+    а также искать по названию, описанию и ингредиентам.
     """
 
     author = filters.NumberFilter(field_name='author_id')
@@ -21,6 +68,7 @@ class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     def filter_is_favorited(self, queryset, name, value):
         """
@@ -40,6 +88,12 @@ class RecipeFilter(FilterSet):
             return queryset.filter(in_shopping_cart__user=request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """
+        Ранжированный поиск рецептов.
+        """
+        return search_recipes(queryset, value)
+
     class Meta:
         """
         Мета-класс для указания модели и полей фильтрации.
@@ -51,10 +105,18 @@ class RecipeFilter(FilterSet):
 
 class IngredientFilter(FilterSet):
     """
-    Фильтр для ингредиентов, позволяющий фильтровать по имени.
+    Фильтр для ингредиентов, позволяющий фильтровать по имени
+    и искать по названию с учётом опечаток.
     """
 
     name = filters.CharFilter(field_name='name', lookup_expr='icontains')
+    search = filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        """
+        Нечёткий поиск ингредиентов по названию.
+        """
+        return filter_by_similarity(queryset, 'name', value)
 
     class Meta:
         """
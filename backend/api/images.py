@@ -0,0 +1,286 @@
+import io
+import logging
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from .cache import invalidate_authors, invalidate_recipes
+from .constants import (IMAGE_VARIANT_QUALITY, IMAGE_VARIANTS,
+                        RELEASE_GRACE_PERIOD)
+from .models import ImageVariantFile
+
+logger = logging.getLogger(__name__)
+
+VARIANT_SEPARATOR = '__'
+# Поле изображения модели и JSON-поле с его вариантами.
+IMAGE_FIELDS = {
+    'api.Recipe': ('image', 'image_variants'),
+    settings.AUTH_USER_MODEL: ('avatar', 'avatar_variants'),
+}
+SAVE_FORMATS = {
+    'JPEG': ('jpg', {'quality': IMAGE_VARIANT_QUALITY, 'optimize': True,
+                     'progressive': True}),
+    'PNG': ('png', {'optimize': True}),
+}
+WEBP_OPTIONS = {'quality': IMAGE_VARIANT_QUALITY, 'method': 4}
+# Сколько имён файлов проверяется на ссылки одним запросом.
+RELEASE_BATCH_SIZE = 200
+
+_executor = None
+_executor_lock = threading.Lock()
+_release_queue = threading.local()
+
+
+def variant_name(name, variant, extension):
+    """
+    Возвращает имя файла варианта: <stem>__<variant>.<ext>
+    в каталоге оригинала.
+    """
+    directory, filename = posixpath.split(name)
+    stem = filename.rsplit('.', 1)[0]
+    return posixpath.join(
+        directory, f'{stem}{VARIANT_SEPARATOR}{variant}.{extension}')
+
+
+def render_variant(image, size, image_format, options):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    if image_format != 'PNG' and variant.mode not in ('RGB', 'L'):
+        variant = variant.convert('RGB')
+    buffer = io.BytesIO()
+    variant.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def generate_variants(storage, name):
+    """
+    Создаёт уменьшенные копии изображения (thumbnail, card, full)
+    в исходном формате и в WebP. Оригинал не увеличивается.
+    Возвращает словарь {вариант: {'default': имя, 'webp': имя}}
+    с ключом source — именем оригинала.
+    """
+    with storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image_format not in SAVE_FORMATS:
+        image_format = 'PNG' if 'A' in image.getbands() else 'JPEG'
+    extension, options = SAVE_FORMATS[image_format]
+    webp = features.check('webp')
+
+    variants = {'source': name}
+    for variant, size in IMAGE_VARIANTS.items():
+        names = {}
+        formats = [('default', extension, image_format, options)]
+        if webp:
+            formats.append(('webp', 'webp', 'WEBP', WEBP_OPTIONS))
+        for key, file_extension, file_format, file_options in formats:
+            names[key] = storage.save(
+                variant_name(name, variant, file_extension),
+                ContentFile(render_variant(
+                    image, size, file_format, file_options)))
+        variants[variant] = names
+    return variants
+
+
+def process_image(model_label, pk, name):
+    """
+    Создаёт варианты изображения объекта и сохраняет их, если
+    за это время изображение не заменили.
+    """
+    model = apps.get_model(model_label)
+    field_name, variants_field = IMAGE_FIELDS[model_label]
+    storage = model._meta.get_field(field_name).storage
+    try:
+        variants = generate_variants(storage, name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+        return None
+    with transaction.atomic():
+        updated = model.objects.filter(
+            pk=pk, **{field_name: name}).update(**{variants_field: variants})
+        if updated:
+            set_variant_files(model_label, pk, variants)
+    if not updated:
+        # Изображение успели заменить или удалить.
+        release_files(model_label, get_variant_names(variants))
+        return None
+    if model_label == 'api.Recipe':
+        invalidate_recipes([pk])
+    else:
+        invalidate_authors([pk])
+    return variants
+
+
+def process_image_in_thread(model_label, pk, name):
+    """
+    Обрабатывает изображение в потоке пула и закрывает соединения
+    с БД, открытые этим потоком.
+    """
+    try:
+        return process_image(model_label, pk, name)
+    except Exception:
+        logger.exception('Не удалось сохранить варианты %s', name)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    """
+    Возвращает общий для процесса пул потоков обработки изображений.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    thread_name_prefix='image-variants')
+    return _executor
+
+
+def schedule_variants(instance):
+    """
+    После фиксации транзакции ставит в очередь создание вариантов
+    изображения объекта, если они ещё не созданы для текущего файла.
+    Для удалённого изображения очищает варианты.
+    """
+    model_label = instance._meta.label
+    field_name, variants_field = IMAGE_FIELDS[model_label]
+    name = getattr(instance, field_name).name
+    variants = getattr(instance, variants_field) or {}
+    if not name:
+        if variants:
+            clear_variants(instance)
+        return
+    if variants.get('source') == name:
+        return
+    pk = instance.pk
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: get_executor().submit(
+            process_image_in_thread, model_label, pk, name))
+    else:
+        transaction.on_commit(
+            lambda: process_image(model_label, pk, name))
+
+
+def get_variant_names(variants):
+    """
+    Возвращает имена файлов вариантов.
+    """
+    return [name for variant in IMAGE_VARIANTS
+            for name in (variants or {}).get(variant, {}).values()]
+
+
+def set_variant_files(model_label, pk, variants):
+    """
+    Записывает в ImageVariantFile имена файлов вариантов объекта
+    вместо прежних.
+    """
+    ImageVariantFile.objects.filter(
+        model_label=model_label, object_id=pk).delete()
+    ImageVariantFile.objects.bulk_create(
+        ImageVariantFile(model_label=model_label, object_id=pk, name=name)
+        for name in get_variant_names(variants))
+
+
+def clear_variants(instance):
+    """
+    Очищает варианты изображения объекта и ссылки на их файлы.
+    """
+    model_label = instance._meta.label
+    variants_field = IMAGE_FIELDS[model_label][1]
+    type(instance).objects.filter(pk=instance.pk).update(
+        **{variants_field: {}})
+    setattr(instance, variants_field, {})
+    set_variant_files(model_label, instance.pk, {})
+
+
+def get_referenced_files(names):
+    """
+    Возвращает имена из names, на которые ссылается хотя бы один
+    объект как на изображение или его вариант. Каждая проверка —
+    поиск по индексу поля изображения или ImageVariantFile.name.
+    """
+    referenced = set(ImageVariantFile.objects.filter(
+        name__in=names).values_list('name', flat=True))
+    for model_label, (field_name, _) in IMAGE_FIELDS.items():
+        remaining = [name for name in names if name not in referenced]
+        if not remaining:
+            break
+        referenced.update(apps.get_model(model_label).objects.filter(
+            **{f'{field_name}__in': remaining}).values_list(
+                field_name, flat=True))
+    return referenced
+
+
+def release_files(model_label, names):
+    """
+    Удаляет файлы, на которые больше не ссылается ни один объект.
+    Файлы, записанные или повторно использованные недавно (их могла
+    только что получить параллельная загрузка того же содержимого),
+    оставляются сборщику мусора.
+    """
+    field_name = IMAGE_FIELDS[model_label][0]
+    storage = apps.get_model(model_label)._meta.get_field(field_name).storage
+    names = sorted(set(filter(None, names)))
+    recent = time.time() - RELEASE_GRACE_PERIOD
+    for start in range(0, len(names), RELEASE_BATCH_SIZE):
+        batch = names[start:start + RELEASE_BATCH_SIZE]
+        referenced = get_referenced_files(batch)
+        for name in batch:
+            if name in referenced:
+                continue
+            try:
+                if storage.get_modified_time(name).timestamp() > recent:
+                    continue
+                storage.delete(name)
+            except FileNotFoundError:
+                continue
+
+
+def release_files_on_commit(model_label, names):
+    """
+    После фиксации транзакции удаляет файлы, на которые больше
+    нет ссылок. Имена копятся до фиксации, поэтому при массовом
+    удалении каждый файл проверяется один раз.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    queue = getattr(_release_queue, 'names', None)
+    if queue is None:
+        queue = _release_queue.names = {}
+    queue.setdefault(model_label, set()).update(names)
+    transaction.on_commit(release_queued_files)
+
+
+def release_queued_files():
+    # Имена из откаченных транзакций тоже проверяются здесь: это
+    # безопасно, так как удаляются только файлы без ссылок.
+    queue = getattr(_release_queue, 'names', None)
+    _release_queue.names = None
+    for model_label, names in (queue or {}).items():
+        release_files(model_label, names)
+
+
+def get_variant_urls(storage, variants, request=None):
+    """
+    Возвращает URL вариантов: {'thumbnail': ..., 'thumbnail_webp': ...}.
+    """
+    urls = {}
+    for variant in IMAGE_VARIANTS:
+        for key, name in (variants or {}).get(variant, {}).items():
+            url = storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant if key == 'default' else f'{variant}_{key}'] = url
+    return urls
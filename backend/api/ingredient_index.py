@@ -0,0 +1,79 @@
+import threading
+import time
+from bisect import bisect_left
+
+from .cache import get_data_version
+from .constants import INGREDIENT_INDEX_TTL, INGREDIENTS_VERSION
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса: отсортированный массив
+    названий в casefold для поиска по префиксу бинарным поиском
+    и по вхождению подстроки.
+    """
+
+    def __init__(self, ingredients, version=None):
+        entries = sorted(
+            (ingredient['name'].casefold(), ingredient['id'], ingredient)
+            for ingredient in ingredients)
+        self.keys = [key for key, _, _ in entries]
+        self.items = [ingredient for _, _, ingredient in entries]
+        self.by_id = {ingredient['id']: ingredient
+                      for ingredient in self.items}
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def search(self, query):
+        """
+        Возвращает ингредиенты, название которых содержит query:
+        сначала совпадения по началу названия, затем остальные.
+        """
+        if not query:
+            return self.items
+        query = query.casefold()
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        return self.items[start:end] + [
+            ingredient
+            for key, ingredient in zip(self.keys, self.items)
+            if query in key and not key.startswith(query)
+        ]
+
+    def get(self, ingredient_id):
+        """
+        Возвращает ингредиент по id или None.
+        """
+        return self.by_id.get(ingredient_id)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    """
+    Возвращает индекс ингредиентов, перестраивая его, если версия
+    ингредиентов изменилась или индекс старше INGREDIENT_INDEX_TTL.
+    Версия читается из БД не чаще раза в DATA_VERSION_CHECK_INTERVAL
+    секунд (см. get_data_version), поэтому запросы автодополнения
+    обычно обходятся без обращений к БД.
+    """
+    global _index
+    version = get_data_version(INGREDIENTS_VERSION)
+    index = _index
+    if (index is None or index.version != version
+            or time.monotonic() - index.built_at > INGREDIENT_INDEX_TTL):
+        with _lock:
+            index = _index
+            if (index is None or index.version != version
+                    or time.monotonic() - index.built_at
+                    > INGREDIENT_INDEX_TTL):
+                index = _index = IngredientIndex(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit').iterator(),
+                    version)
+    return index
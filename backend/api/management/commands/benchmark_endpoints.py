@@ -0,0 +1,477 @@
+import base64
+import io
+import json
+import math
+import platform
+import statistics
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from PIL import Image
+
+User = get_user_model()
+
+
+class QueryCollector:
+    """
+    Обёртка execute_wrapper, считающая запросы и их суммарное время.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - started
+
+
+class InProcessClient:
+    """
+    Выполняет запросы через django.test.Client в том же процессе
+    и измеряет количество и время SQL-запросов.
+    """
+
+    def __init__(self, host):
+        self.client = Client(HTTP_HOST=host)
+
+    def request(self, method, path, data=None, token=None):
+        headers = {}
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+        if data is not None:
+            headers['data'] = json.dumps(data)
+            headers['content_type'] = 'application/json'
+        collector = QueryCollector()
+        started = time.perf_counter()
+        with connection.execute_wrapper(collector):
+            response = getattr(self.client, method.lower())(path, **headers)
+            if response.streaming:
+                body = b''.join(response.streaming_content)
+            else:
+                body = response.content
+        elapsed = time.perf_counter() - started
+        return (response.status_code, body, elapsed,
+                collector.count, collector.time)
+
+
+class HttpClient:
+    """
+    Выполняет запросы к запущенному серверу. Количество
+    SQL-запросов в этом режиме недоступно.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(NoRedirectHandler)
+
+    def request(self, method, path, data=None, token=None):
+        headers = {}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(
+            self.base_url + path, data=body, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, content = error.code, error.read()
+        return status, content, time.perf_counter() - started, None, None
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def with_query(path, **params):
+    """
+    Добавляет к пути строку запроса, кодируя значения (в том числе
+    кириллицу) для передачи в URL.
+    """
+    return f'{path}?{urlencode(params)}'
+
+
+def percentile(values, fraction):
+    """
+    Процентиль методом ближайшего ранга.
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def placeholder_image():
+    """
+    Возвращает небольшую картинку в формате data URI для рецептов
+    и аватаров.
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), (200, 120, 80)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    help = ('Измеряет задержку (p50/p95), количество и время SQL-запросов '
+            'для всех маршрутов API и коротких ссылок, сохраняет отчёт '
+            'в JSON и сравнивает его с базовым')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Количество замеров каждого маршрута')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Количество прогревочных запросов')
+        parser.add_argument('--email', default='seed_0@example.com',
+                            help='Email пользователя для авторизации')
+        parser.add_argument('--password', default='seed-password',
+                            help='Пароль пользователя для авторизации')
+        parser.add_argument('--base-url',
+                            help='Адрес запущенного сервера; по умолчанию '
+                                 'запросы выполняются тестовым клиентом')
+        parser.add_argument('--output', help='Путь к JSON-отчёту')
+        parser.add_argument('--compare',
+                            help='Базовый JSON-отчёт для сравнения')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Допустимый рост p95, в процентах')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Рост p95 меньше этого значения '
+                                 'не считается регрессией')
+        parser.add_argument('--query-threshold', type=int, default=0,
+                            help='Допустимый рост количества запросов')
+
+    def handle(self, *args, **kwargs):
+        self.options = kwargs
+        if kwargs['iterations'] < 1:
+            raise CommandError('--iterations должен быть больше нуля.')
+        if kwargs['base_url']:
+            self.client = HttpClient(kwargs['base_url'])
+        else:
+            host = next((host for host in settings.ALLOWED_HOSTS
+                         if host not in ('*', '')), 'localhost')
+            self.client = InProcessClient(host.lstrip('.'))
+        self.samples = {}
+        self.created_usernames = []
+
+        self.token = self.login()
+        context = self.discover()
+        for name, method, path, data, token in self.get_cases(context):
+            self.measure(name, method, path, data, token)
+        self.measure_scenarios(context)
+        self.cleanup()
+
+        report = self.build_report()
+        self.print_report(report)
+        if kwargs['output']:
+            with open(kwargs['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчёт сохранён в {kwargs["output"]}')
+        if kwargs['compare']:
+            self.compare(report)
+
+    def call(self, method, path, data=None, token=None, expected=None):
+        """
+        Выполняет запрос без замера, проверяя статус ответа.
+        """
+        status, body, *_ = self.client.request(method, path, data, token)
+        if expected and status not in expected:
+            raise CommandError(
+                f'{method} {path}: ожидался статус {expected}, '
+                f'получен {status}: {body[:200]!r}')
+        return json.loads(body) if body else None
+
+    def login(self):
+        data = self.call(
+            'POST', '/api/auth/token/login/',
+            {'email': self.options['email'],
+             'password': self.options['password']}, expected=(200,))
+        return data['auth_token']
+
+    def discover(self):
+        """
+        Находит через API объекты, на которых выполняются замеры.
+        """
+        token = self.token
+        me = self.call('GET', '/api/users/me/', token=token, expected=(200,))
+        recipes = self.call('GET', with_query('/api/recipes/', limit=50),
+                            token=token, expected=(200,))['results']
+        if not recipes:
+            raise CommandError('Нет рецептов, выполните seed_fake_data.')
+        foreign = [recipe for recipe in recipes
+                   if recipe['author']['id'] != me['id']] or recipes
+        recipe = next((recipe for recipe in foreign
+                       if not recipe['is_favorited']
+                       and not recipe['is_in_shopping_cart']), foreign[0])
+        author = next((recipe['author'] for recipe in foreign
+                       if not recipe['author']['is_subscribed']), None)
+        tags = self.call('GET', '/api/tags/', expected=(200,))
+        ingredients = self.call(
+            'GET', with_query('/api/ingredients/', name='а'),
+            expected=(200,))
+        link = self.call('GET', f'/api/recipes/{recipe["id"]}/get-link/',
+                         expected=(200,))['short-link']
+        return {
+            'me': me,
+            'recipe': recipe,
+            'author': author,
+            'tag': tags[0],
+            'ingredient': ingredients[0],
+            'short_path': '/s/' + link.rstrip('/').rsplit('/', 1)[-1] + '/',
+        }
+
+    def get_cases(self, context):
+        """
+        Возвращает запросы без побочных эффектов:
+        (имя, метод, путь, данные, токен).
+        """
+        token = self.token
+        recipe_id = context['recipe']['id']
+        tag = context['tag']
+        ingredient = context['ingredient']
+        ingredient_prefix = ingredient['name'][:3]
+        return [
+            ('tags-list', 'GET', '/api/tags/', None, None),
+            ('tags-detail', 'GET', f'/api/tags/{tag["id"]}/', None, None),
+            ('ingredients-list', 'GET', '/api/ingredients/', None, None),
+            ('ingredients-name', 'GET',
+             with_query('/api/ingredients/', name=ingredient_prefix),
+             None, None),
+            ('ingredients-search', 'GET',
+             with_query('/api/ingredients/', search=ingredient_prefix),
+             None, None),
+            ('ingredients-detail', 'GET',
+             f'/api/ingredients/{ingredient["id"]}/', None, None),
+            ('recipes-list-anonymous', 'GET', '/api/recipes/', None, None),
+            ('recipes-list', 'GET', '/api/recipes/', None, token),
+            ('recipes-list-cursor', 'GET',
+             with_query('/api/recipes/', cursor=''), None, token),
+            ('recipes-list-tags', 'GET',
+             with_query('/api/recipes/', tags=tag['slug']), None, token),
+            ('recipes-list-author', 'GET',
+             with_query('/api/recipes/',
+                        author=context['recipe']['author']['id']),
+             None, token),
+            ('recipes-list-favorited', 'GET',
+             with_query('/api/recipes/', is_favorited=1), None, token),
+            ('recipes-list-in-cart', 'GET',
+             with_query('/api/recipes/', is_in_shopping_cart=1), None, token),
+            ('recipes-search', 'GET',
+             with_query('/api/recipes/',
+                        search=context['recipe']['name'][:5]),
+             None, token),
+            ('recipes-detail', 'GET', f'/api/recipes/{recipe_id}/',
+             None, token),
+            ('recipes-get-link', 'GET', f'/api/recipes/{recipe_id}/get-link/',
+             None, None),
+            ('recipes-download-shopping-cart', 'GET',
+             '/api/recipes/download_shopping_cart/', None, token),
+            ('short-link', 'GET', context['short_path'], None, None),
+            ('users-list', 'GET', '/api/users/', None, token),
+            ('users-me', 'GET', '/api/users/me/', None, token),
+            ('users-detail', 'GET',
+             f'/api/users/{context["recipe"]["author"]["id"]}/', None, token),
+            ('users-subscriptions', 'GET',
+             with_query('/api/users/subscriptions/', recipes_limit=3),
+             None, token),
+        ]
+
+    def measure(self, name, method, path, data=None, token=None):
+        """
+        Прогревает маршрут и выполняет нужное число замеров.
+        """
+        for _ in range(self.options['warmup']):
+            self.client.request(method, path, data, token)
+        for _ in range(self.options['iterations']):
+            self.record(name, method, path, data, token)
+
+    def record(self, name, method, path, data=None, token=None,
+               expected=None):
+        """
+        Выполняет и замеряет запрос. Если задан expected, а статус
+        ответа другой, прерывает замер: ответ нужен следующим запросам.
+        """
+        status, body, elapsed, queries, sql_time = self.client.request(
+            method, path, data, token)
+        sample = self.samples.setdefault(name, {
+            'method': method, 'path': path, 'statuses': set(),
+            'latency': [], 'queries': [], 'sql_time': []})
+        sample['statuses'].add(status)
+        sample['latency'].append(elapsed)
+        if queries is not None:
+            sample['queries'].append(queries)
+            sample['sql_time'].append(sql_time)
+        if expected and status not in expected:
+            raise CommandError(
+                f'{method} {path}: ожидался статус {expected}, '
+                f'получен {status}: {body[:200]!r}')
+        return body
+
+    def measure_scenarios(self, context):
+        """
+        Замеряет изменяющие запросы парами, которые возвращают
+        данные в исходное состояние.
+        """
+        token = self.token
+        recipe_id = context['recipe']['id']
+        image = placeholder_image()
+        for _ in range(self.options['iterations']):
+            for action in ('favorite', 'shopping_cart'):
+                path = f'/api/recipes/{recipe_id}/{action}/'
+                self.record(f'recipes-{action}-add', 'POST', path,
+                            token=token)
+                self.record(f'recipes-{action}-remove', 'DELETE', path,
+                            token=token)
+            if context['author']:
+                path = f'/api/users/{context["author"]["id"]}/subscribe/'
+                self.record('users-subscribe', 'POST',
+                            with_query(path, recipes_limit=3), token=token)
+                self.record('users-unsubscribe', 'DELETE', path,
+                            token=token)
+
+            recipe = {
+                'ingredients': [{'id': context['ingredient']['id'],
+                                 'amount': 10}],
+                'tags': [context['tag']['id']],
+                'image': image,
+                'name': 'Рецепт для замера',
+                'text': 'Описание рецепта для замера',
+                'cooking_time': 10,
+            }
+            created = json.loads(self.record(
+                'recipes-create', 'POST', '/api/recipes/', recipe, token,
+                expected=(201,)))
+            path = f'/api/recipes/{created["id"]}/'
+            self.record('recipes-update', 'PATCH', path,
+                        {**recipe, 'cooking_time': 20}, token)
+            self.record('recipes-delete', 'DELETE', path, token=token)
+
+            self.record('users-avatar-set', 'PUT', '/api/users/me/avatar/',
+                        {'avatar': image}, token)
+            self.record('users-avatar-delete', 'DELETE',
+                        '/api/users/me/avatar/', token=token)
+
+            self.record('users-set-password', 'POST',
+                        '/api/users/set_password/',
+                        {'current_password': self.options['password'],
+                         'new_password': self.options['password']}, token)
+
+            username = f'benchmark_{time.time_ns()}'
+            self.created_usernames.append(username)
+            self.record('users-create', 'POST', '/api/users/', {
+                'email': f'{username}@example.com',
+                'username': username,
+                'first_name': 'Замер',
+                'last_name': 'Замеров',
+                'password': 'Benchmark-password-1',
+            })
+
+            login = json.loads(self.record(
+                'auth-login', 'POST', '/api/auth/token/login/',
+                {'email': self.options['email'],
+                 'password': self.options['password']}, expected=(200,)))
+            self.record('auth-logout', 'POST', '/api/auth/token/logout/',
+                        token=login['auth_token'])
+            self.token = token = self.login()
+
+    def cleanup(self):
+        """
+        Удаляет пользователей, созданных при замерах, если запросы
+        выполнялись в том же процессе.
+        """
+        if isinstance(self.client, InProcessClient):
+            User.objects.filter(username__in=self.created_usernames).delete()
+        elif self.created_usernames:
+            self.stdout.write(self.style.WARNING(
+                f'Созданы пользователи: {len(self.created_usernames)}, '
+                f'префикс benchmark_.'))
+
+    def build_report(self):
+        endpoints = {}
+        for name, sample in sorted(self.samples.items()):
+            latency = [value * 1000 for value in sample['latency']]
+            endpoints[name] = {
+                'method': sample['method'],
+                'path': sample['path'],
+                'statuses': sorted(sample['statuses']),
+                'iterations': len(latency),
+                'p50_ms': round(percentile(latency, 0.5), 3),
+                'p95_ms': round(percentile(latency, 0.95), 3),
+                'mean_ms': round(statistics.mean(latency), 3),
+                'queries': (max(sample['queries'])
+                            if sample['queries'] else None),
+                'sql_ms': (round(statistics.median(sample['sql_time'])
+                                 * 1000, 3)
+                           if sample['sql_time'] else None),
+            }
+        return {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'mode': self.options['base_url'] or 'test-client',
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'iterations': self.options['iterations'],
+            },
+            'endpoints': endpoints,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"endpoint":34} {"status":>9} {"p50 ms":>9} {"p95 ms":>9} '
+            f'{"queries":>8} {"sql ms":>8}')
+        for name, result in report['endpoints'].items():
+            statuses = ','.join(map(str, result['statuses']))
+            line = (f'{name:34} {statuses:>9} {result["p50_ms"]:>9.2f} '
+                    f'{result["p95_ms"]:>9.2f} '
+                    f'{str(result["queries"]):>8} '
+                    f'{str(result["sql_ms"]):>8}')
+            if any(status >= 400 for status in result['statuses']):
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+
+    def compare(self, report):
+        """
+        Сравнивает отчёт с базовым и завершает команду с ошибкой
+        при регрессиях задержки или количества запросов.
+        """
+        with open(self.options['compare'], encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        threshold = self.options['threshold'] / 100
+        regressions = []
+        for name, result in report['endpoints'].items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            delta = result['p95_ms'] - base['p95_ms']
+            if (delta > self.options['min_delta_ms']
+                    and result['p95_ms'] > base['p95_ms'] * (1 + threshold)):
+                regressions.append(
+                    f'{name}: p95 {base["p95_ms"]:.2f} → '
+                    f'{result["p95_ms"]:.2f} мс')
+            if (result['queries'] is not None
+                    and base['queries'] is not None
+                    and result['queries'] - base['queries']
+                    > self.options['query_threshold']):
+                regressions.append(
+                    f'{name}: запросов {base["queries"]} → '
+                    f'{result["queries"]}')
+        if regressions:
+            raise CommandError(
+                'Обнаружены регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базового отчёта нет.'))
@@ -0,0 +1,159 @@
+import base64
+import gc
+import io
+import os
+import statistics
+import time
+import tracemalloc
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+from rest_framework import serializers
+
+from api.serializers import Base64ImageField
+
+PROC_STATUS = '/proc/self/status'
+PROC_CLEAR_REFS = '/proc/self/clear_refs'
+MEGABYTE = 1024 * 1024
+
+
+def read_status(field):
+    """
+    Возвращает значение поля /proc/self/status в байтах или None,
+    если оно недоступно (не Linux).
+    """
+    try:
+        with open(PROC_STATUS) as file:
+            for line in file:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss():
+    """
+    Сбрасывает пиковый RSS процесса (VmHWM). Возвращает False,
+    если ядро это не поддерживает.
+    """
+    try:
+        with open(PROC_CLEAR_REFS, 'w') as file:
+            file.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def legacy_to_internal_value(data):
+    """
+    Прежняя обработка Base64ImageField: декодирование всей строки
+    в память и проверка изображения ImageField.
+    """
+    format, imgstr = data.split(';base64,')
+    ext = format.split('/')[-1]
+    file = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
+    return serializers.ImageField().to_internal_value(file)
+
+
+class Command(BaseCommand):
+    help = ('Измеряет время и пиковое потребление памяти при обработке '
+            'загружаемого изображения: прежний Base64ImageField, '
+            'потоковое декодирование base64 и multipart-загрузка')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=3200)
+        parser.add_argument('--height', type=int, default=2400)
+        parser.add_argument('--format', default='JPEG',
+                            choices=['JPEG', 'PNG', 'WEBP'])
+        parser.add_argument('--quality', type=int, default=75,
+                            help='Качество JPEG/WebP тестового изображения')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **kwargs):
+        if kwargs['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля.')
+        content = self.make_image(kwargs)
+        data = (f'data:image/{kwargs["format"].lower()};base64,'
+                + base64.b64encode(content).decode())
+        self.stdout.write(
+            f'Изображение {kwargs["width"]}x{kwargs["height"]} '
+            f'{kwargs["format"]}: {len(content) / MEGABYTE:.1f} МБ, '
+            f'base64 {len(data) / MEGABYTE:.1f} МБ')
+
+        field = Base64ImageField()
+        cases = {
+            'legacy base64': lambda: legacy_to_internal_value(data),
+            'base64': lambda: field.to_internal_value(data),
+            'multipart': lambda upload: field.to_internal_value(upload),
+        }
+        self.stdout.write(
+            f'{"вариант":<15}{"время, мс":>12}{"Python, МБ":>13}'
+            f'{"RSS, МБ":>10}')
+        for name, case in cases.items():
+            timings, python_peaks, rss_peaks = [], [], []
+            for _ in range(kwargs['repeat']):
+                arguments = ()
+                if name == 'multipart':
+                    arguments = (self.make_upload(content, kwargs),)
+                duration, python_peak, rss_peak = self.measure(
+                    case, *arguments)
+                timings.append(duration)
+                python_peaks.append(python_peak)
+                rss_peaks.append(rss_peak)
+            rss = ('-' if None in rss_peaks
+                   else f'{max(rss_peaks) / MEGABYTE:.1f}')
+            self.stdout.write(
+                f'{name:<15}{statistics.median(timings) * 1000:>12.1f}'
+                f'{max(python_peaks) / MEGABYTE:>13.1f}{rss:>10}')
+        self.stdout.write(
+            'Python — пик выделений, видимых tracemalloc; RSS — прирост '
+            'пикового RSS процесса (VmHWM, только Linux), включая буферы '
+            'Pillow.')
+
+    @staticmethod
+    def make_image(options):
+        """
+        Создаёт плохо сжимаемое изображение из случайного шума.
+        """
+        size = (options['width'], options['height'])
+        image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+        buffer = io.BytesIO()
+        save_options = {}
+        if options['format'] != 'PNG':
+            save_options['quality'] = options['quality']
+        image.save(buffer, options['format'], **save_options)
+        return buffer.getvalue()
+
+    @staticmethod
+    def make_upload(content, options):
+        """
+        Имитирует файл, который загрузчик Django записал на диск.
+        """
+        upload = TemporaryUploadedFile(
+            f'upload.{options["format"].lower()}',
+            f'image/{options["format"].lower()}', len(content), None)
+        upload.write(content)
+        upload.seek(0)
+        return upload
+
+    @staticmethod
+    def measure(case, *arguments):
+        gc.collect()
+        rss_supported = reset_peak_rss()
+        rss_before = read_status('VmRSS')
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = case(*arguments)
+        duration = time.perf_counter() - started
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rss_peak = None
+        if rss_supported and rss_before is not None:
+            rss_peak = read_status('VmHWM') - rss_before
+        result.close()
+        for argument in arguments:
+            argument.close()
+        return duration, python_peak, rss_peak
@@ -0,0 +1,192 @@
+import hashlib
+import heapq
+import os
+import shutil
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from api.images import IMAGE_FIELDS, get_variant_names
+from api.models import ImageVariantFile
+from api.storage import BLOB_DIRECTORY
+
+# Каталоги MEDIA_ROOT, в которые сохраняются картинки рецептов
+# и аватары (в том числе до перехода на хранение по хэшу).
+MEDIA_DIRECTORIES = (BLOB_DIRECTORY, 'recipes/images', 'users')
+# Сколько хэшей сортируется за раз.
+SORT_CHUNK = 1_000_000
+
+
+def name_hash(name):
+    """
+    Возвращает 64-битный хэш имени файла. Ссылки хранятся в виде
+    таких хэшей (8 байт на ссылку); коллизия может только оставить
+    лишний файл, но не удалить используемый.
+    """
+    return int.from_bytes(
+        hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big')
+
+
+class ReferenceSet:
+    """
+    Отсортированный массив хэшей имён файлов, на которые ссылаются
+    объекты в БД.
+    """
+
+    def __init__(self):
+        self.hashes = array('Q')
+
+    def add(self, name):
+        if name:
+            self.hashes.append(name_hash(name))
+
+    def freeze(self):
+        """
+        Сортирует хэши и убирает повторы. Сортировка идёт частями,
+        которые затем сливаются, чтобы не создавать список из всех
+        хэшей сразу.
+        """
+        chunks = [array('Q', sorted(self.hashes[start:start + SORT_CHUNK]))
+                  for start in range(0, len(self.hashes), SORT_CHUNK)]
+        self.hashes = array('Q')
+        previous = None
+        for value in heapq.merge(*chunks):
+            if value != previous:
+                self.hashes.append(value)
+                previous = value
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, name):
+        value = name_hash(name)
+        index = bisect_left(self.hashes, value)
+        return index < len(self.hashes) and self.hashes[index] == value
+
+
+def walk_files(root, directory):
+    """
+    Обходит файлы каталога directory внутри root через os.scandir,
+    не собирая список файлов в памяти. Возвращает пары
+    (имя относительно root, DirEntry).
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            iterator = os.scandir(root / current)
+        except FileNotFoundError:
+            continue
+        with iterator as entries:
+            for entry in entries:
+                name = f'{current}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT картинки рецептов и аватары, на которые '
+            'не ссылается ни один объект и которые старше периода ожидания')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено')
+        parser.add_argument('--quarantine', metavar='DIR',
+                            help='Переместить файлы в каталог вместо '
+                                 'удаления')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Не трогать файлы моложе этого возраста')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Размер пачки строк при чтении из БД')
+
+    def handle(self, *args, **kwargs):
+        if not isinstance(default_storage, FileSystemStorage):
+            raise CommandError(
+                'Команда работает только с файловым хранилищем.')
+        if kwargs['grace_hours'] < 0:
+            raise CommandError('--grace-hours не может быть отрицательным.')
+        root = Path(default_storage.location)
+        quarantine = kwargs['quarantine'] and Path(kwargs['quarantine'])
+        if quarantine and quarantine.resolve().is_relative_to(root.resolve()):
+            raise CommandError('Каталог карантина не может быть внутри '
+                               'MEDIA_ROOT.')
+
+        # Ссылки собираются до обхода файлов: файл, получивший ссылку
+        # позже, новее периода ожидания (хранилище обновляет время
+        # изменения при повторной загрузке).
+        started = time.monotonic()
+        references = self.collect_references(kwargs['chunk_size'])
+        self.stdout.write(
+            f'Ссылок на файлы: {len(references)} '
+            f'({references.hashes.itemsize * len(references) // 1024} КБ) '
+            f'за {time.monotonic() - started:.2f} с.')
+
+        cutoff = time.time() - kwargs['grace_hours'] * 3600
+        scanned = recent = orphaned = orphaned_size = failed = 0
+        for directory in MEDIA_DIRECTORIES:
+            for name, entry in walk_files(root, directory):
+                scanned += 1
+                if name in references:
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > cutoff:
+                    recent += 1
+                    continue
+                orphaned += 1
+                orphaned_size += stat.st_size
+                if kwargs['verbosity'] > 1 or kwargs['dry_run']:
+                    self.stdout.write(name)
+                if kwargs['dry_run']:
+                    continue
+                try:
+                    if quarantine:
+                        target = quarantine / name
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.move(root / name, target)
+                    else:
+                        os.remove(root / name)
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+
+        action = ('Будет удалено' if kwargs['dry_run']
+                  else 'Перемещено в карантин' if quarantine else 'Удалено')
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено файлов: {scanned}, моложе периода ожидания: '
+            f'{recent}. {action}: {orphaned - failed} '
+            f'({orphaned_size / 1024 / 1024:.1f} МБ), ошибок: {failed}. '
+            f'Время: {time.monotonic() - started:.2f} с.'))
+
+    @staticmethod
+    def collect_references(chunk_size):
+        """
+        Потоково читает из БД имена картинок, аватаров и их вариантов
+        (из JSON-полей и из ImageVariantFile).
+        """
+        references = ReferenceSet()
+        for model_label, (field_name, variants_field) in IMAGE_FIELDS.items():
+            rows = (apps.get_model(model_label).objects
+                    .order_by()
+                    .values_list(field_name, variants_field)
+                    .iterator(chunk_size=chunk_size))
+            for name, variants in rows:
+                references.add(name)
+                for variant in get_variant_names(variants):
+                    references.add(variant)
+        rows = (ImageVariantFile.objects.order_by()
+                .values_list('name', flat=True)
+                .iterator(chunk_size=chunk_size))
+        for name in rows:
+            references.add(name)
+        references.freeze()
+        return references
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from api.images import IMAGE_FIELDS, process_image_in_thread
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии (thumbnail, card, full и WebP) '
+            'для уже загруженных картинок рецептов и аватаров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Количество потоков обработки')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать варианты для всех картинок')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['workers'] < 1:
+            raise CommandError('--workers должен быть больше нуля.')
+        tasks = []
+        for model_label, (field_name, variants_field) in IMAGE_FIELDS.items():
+            model = apps.get_model(model_label)
+            rows = (model.objects
+                    .exclude(**{field_name: ''})
+                    .exclude(**{f'{field_name}__isnull': True})
+                    .order_by('pk')
+                    .values_list('pk', field_name, variants_field))
+            for pk, name, variants in rows.iterator():
+                if kwargs['force'] or (variants or {}).get('source') != name:
+                    tasks.append((model_label, pk, name))
+
+        started = time.monotonic()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=kwargs['workers']) as executor:
+            for number, result in enumerate(executor.map(
+                    lambda task: process_image_in_thread(*task), tasks),
+                    start=1):
+                failed += result is None
+                if number % 100 == 0:
+                    self.stdout.write(f'Обработано {number} из {len(tasks)}')
+
+        message = (f'Обработано картинок: {len(tasks)}, ошибок: {failed} '
+                   f'за {time.monotonic() - started:.2f} с.')
+        if failed:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -1,37 +1,156 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_data_version
+from api.constants import INGREDIENTS_VERSION
 from api.models import Ingredient
 
+SOURCE_SUFFIXES = ('.csv', '.json')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """
+    Построчно читает пары (название, единица измерения) из CSV.
+    """
+    for line_number, row in enumerate(csv.reader(file), start=1):
+        if not row:
+            continue
+        if len(row) != 2:
+            raise CommandError(
+                f'Строка {line_number}: ожидалось 2 столбца, '
+                f'получено {len(row)}.')
+        yield row
+
+
+def iter_json_array(file):
+    """
+    Потоково разбирает JSON-массив объектов, читая файл кусками
+    и не загружая его в память целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), ''):
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('JSON должен содержать массив.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            position = end
+            yield item
+    if buffer[position:].strip():
+        raise CommandError('Некорректный JSON в конце файла.')
+
+
+def read_json(file):
+    """
+    Читает пары (название, единица измерения) из JSON-массива
+    объектов с ключами name и measurement_unit.
+    """
+    for number, item in enumerate(iter_json_array(file), start=1):
+        try:
+            yield item['name'], item['measurement_unit']
+        except (KeyError, TypeError):
+            raise CommandError(
+                f'Элемент {number}: ожидался объект с ключами '
+                f'name и measurement_unit.')
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
 
 class Command(BaseCommand):
-    help = 'Загружает данные из CSV файла в модель Ingredient'
+    help = ('Загружает ингредиенты из CSV или JSON файла '
+            '(или всех таких файлов каталога) в модель Ingredient')
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_file', type=str,
-                            help='Путь к CSV файлу для загрузки данных')
+        parser.add_argument('path', type=str,
+                            help='Путь к CSV/JSON файлу или каталогу')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Количество строк в одной вставке')
 
     def handle(self, *args, **kwargs):
-        csv_file_path = kwargs['csv_file']
+        batch_size = kwargs['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        paths = self.get_paths(Path(kwargs['path']))
 
-        try:
-            with open(csv_file_path, mode='r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-
-                for row in reader:
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
-
-            self.stdout.write(self.style.SUCCESS(
-                'Данные успешно загружены из файла "%s"' % csv_file_path))
-
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(
-                'Файл не найден: "%s"' % csv_file_path))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(
-                f'Ошибка при загрузке данных: {e}'))
+        started = time.monotonic()
+        count_before = Ingredient.objects.count()
+        processed = 0
+        with transaction.atomic():
+            for path in paths:
+                processed += self.load_file(path, batch_size)
+            inserted = Ingredient.objects.count() - count_before
+            bump_data_version(INGREDIENTS_VERSION)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено: {inserted}, '
+            f'пропущено: {processed - inserted} за {elapsed:.2f} с '
+            f'({processed / max(elapsed, 1e-6):.0f} строк/с).'))
+
+    def get_paths(self, path):
+        """
+        Возвращает список файлов для загрузки.
+        """
+        if path.is_dir():
+            paths = sorted(file for file in path.iterdir()
+                           if file.suffix.lower() in SOURCE_SUFFIXES)
+            if not paths:
+                raise CommandError(
+                    f'В каталоге "{path}" нет CSV или JSON файлов.')
+            return paths
+        if not path.is_file():
+            raise CommandError(f'Файл не найден: "{path}"')
+        if path.suffix.lower() not in SOURCE_SUFFIXES:
+            raise CommandError(
+                f'Неподдерживаемый формат файла: "{path}"')
+        return [path]
+
+    def load_file(self, path, batch_size):
+        """
+        Вставляет ингредиенты из файла пачками, пропуская уже
+        существующие. Возвращает количество прочитанных строк.
+        """
+        processed = 0
+        with open(path, mode='r', encoding='utf-8') as file:
+            rows = READERS[path.suffix.lower()](file)
+            while True:
+                batch = [
+                    Ingredient(name=name.strip(),
+                               measurement_unit=measurement_unit.strip())
+                    for name, measurement_unit in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(
+                    batch, ignore_conflicts=True)
+                processed += len(batch)
+        self.stdout.write(f'{path}: прочитано строк {processed}.')
+        return processed
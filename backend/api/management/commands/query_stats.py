@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.query_stats import SORT_FIELDS, query_stats
+
+
+class Command(BaseCommand):
+    help = ('Выводит самые тяжёлые SQL-запросы по отпечаткам, '
+            'накопленные всеми процессами приложения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20,
+                            help='Количество отпечатков в отчёте')
+        parser.add_argument('--sort', choices=SORT_FIELDS, default='total',
+                            help='Поле сортировки')
+        parser.add_argument('--view',
+                            help='Только запросы указанного представления, '
+                                 'например "GET recipes-list"')
+        parser.add_argument('--group-by-fingerprint', action='store_true',
+                            help='Суммировать статистику по представлениям')
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести отчёт в JSON')
+        parser.add_argument('--reset', action='store_true',
+                            help='Сбросить накопленную статистику')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['reset']:
+            query_stats.reset()
+            self.stdout.write(self.style.SUCCESS('Статистика сброшена.'))
+            return
+        entries = query_stats.top(
+            limit=kwargs['top'], sort=kwargs['sort'], view=kwargs['view'],
+            by_view=not kwargs['group_by_fingerprint'])
+        if kwargs['json']:
+            self.stdout.write(json.dumps(entries, ensure_ascii=False,
+                                         indent=2))
+            return
+        if not entries:
+            self.stdout.write('Статистика пока не накоплена.')
+            return
+        for entry in entries:
+            self.stdout.write(
+                f'{entry["count"]:>8} вызовов  '
+                f'всего {entry["total"] * 1000:>10.1f} мс  '
+                f'среднее {entry["mean"] * 1000:>8.2f} мс  '
+                f'макс. {entry["max"] * 1000:>8.2f} мс  '
+                f'{entry["view"] or ""}')
+            self.stdout.write(f'    {entry["fingerprint"]}')
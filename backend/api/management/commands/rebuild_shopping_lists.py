@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from api.shopping_list import (calculate_shopping_lists,
+                               get_stored_shopping_lists,
+                               rebuild_shopping_lists)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает агрегированные списки покупок по корзинам '
+            'или проверяет их согласованность (--check)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить списки, ничего не менять')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Количество пользователей в одной пачке')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
+        user_ids = (
+            User.objects
+            .filter(Q(shopping_cart__isnull=False)
+                    | Q(shopping_list__isnull=False))
+            .distinct()
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        batch = []
+        processed = 0
+        inconsistent = []
+        for user_id in user_ids.iterator():
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                inconsistent += self.process(batch, kwargs['check'])
+                processed += len(batch)
+                batch = []
+        if batch:
+            inconsistent += self.process(batch, kwargs['check'])
+            processed += len(batch)
+
+        if not kwargs['check']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок пересобраны для {processed} пользователей.'))
+            return
+        if inconsistent:
+            raise CommandError(
+                f'Несогласованные списки покупок у {len(inconsistent)} '
+                f'из {processed} пользователей: {inconsistent}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок {processed} пользователей согласованы.'))
+
+    def process(self, user_ids, check):
+        """
+        Проверяет или пересобирает списки покупок пачки пользователей.
+        Возвращает id пользователей с несогласованными списками.
+        """
+        if not check:
+            rebuild_shopping_lists(user_ids)
+            return []
+        expected = calculate_shopping_lists(user_ids)
+        stored = get_stored_shopping_lists(user_ids)
+        return [user_id for user_id in user_ids
+                if expected.get(user_id, {}) != stored.get(user_id, {})]
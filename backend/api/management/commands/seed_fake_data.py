@@ -0,0 +1,350 @@
+import csv
+import io
+import random
+import time
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from api.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                        ShoppingCart, Tag)
+from api.search import update_search_vectors_in_batches
+from api.shopping_list import rebuild_shopping_lists
+
+User = get_user_model()
+
+PLACEHOLDER_IMAGE = 'recipes/images/seed_placeholder.png'
+SHORT_CODE_MULTIPLIER = 2654435761
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+DISHES = ('суп', 'салат', 'пирог', 'рагу', 'омлет', 'плов', 'запеканка',
+          'паста', 'каша', 'жаркое', 'котлеты', 'блины')
+ADJECTIVES = ('домашний', 'быстрый', 'праздничный', 'летний', 'острый',
+              'сытный', 'бабушкин', 'лёгкий', 'пряный', 'осенний')
+WORDS = ('нарезать', 'смешать', 'обжарить', 'добавить', 'посолить',
+         'довести', 'до', 'кипения', 'запекать', 'минут', 'подавать',
+         'горячим', 'с', 'зеленью', 'и', 'сметаной', 'на', 'сковороде')
+
+
+def chunked(iterable, size):
+    """
+    Разбивает итерируемый объект на списки длиной до size.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def power_law_weights(count, skew):
+    """
+    Возвращает накопленные веса распределения Ципфа для count элементов:
+    элемент с рангом r выбирается пропорционально r ** -skew.
+    """
+    return list(accumulate((rank ** -skew for rank in range(1, count + 1))))
+
+
+def insert_rows(model, columns, rows, batch_size):
+    """
+    Вставляет строки в таблицу модели: через COPY в PostgreSQL,
+    пачками executemany на остальных СУБД. Возвращает число строк.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    column_list = ', '.join(connection.ops.quote_name(column)
+                            for column in columns)
+    inserted = 0
+    with connection.cursor() as cursor:
+        for batch in chunked(rows, batch_size):
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {table} ({column_list}) FROM STDIN '
+                    f'WITH (FORMAT csv)', buffer)
+            else:
+                placeholders = ', '.join(['%s'] * len(columns))
+                cursor.executemany(
+                    f'INSERT INTO {table} ({column_list}) '
+                    f'VALUES ({placeholders})', batch)
+            inserted += len(batch)
+    return inserted
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетические данные для нагрузочного '
+            'тестирования: пользователей, рецепты, избранное, корзины '
+            'и подписки со степенным распределением популярности')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Количество пользователей')
+        parser.add_argument('--recipes', type=int, default=10000,
+                            help='Количество рецептов')
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 10), metavar=('MIN', 'MAX'),
+                            help='Границы числа ингредиентов в рецепте')
+        parser.add_argument('--favorites', type=int, default=10,
+                            help='Среднее число избранных на пользователя')
+        parser.add_argument('--carts', type=int, default=3,
+                            help='Среднее число рецептов в корзине')
+        parser.add_argument('--subscriptions', type=int, default=5,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель степенного распределения '
+                                 'популярности авторов и рецептов')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Начальное значение генератора')
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс имён создаваемых пользователей')
+        parser.add_argument('--password', default='seed-password',
+                            help='Пароль всех создаваемых пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Количество строк в одной вставке')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданных пользователей '
+                                 'с тем же префиксом и их данные')
+
+    def handle(self, *args, **kwargs):
+        self.options = kwargs
+        self.rng = random.Random(kwargs['seed'])
+        self.batch_size = kwargs['batch_size']
+        min_ingredients, max_ingredients = kwargs['ingredients_per_recipe']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        if kwargs['users'] < 1 or kwargs['recipes'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        if not 0 <= min_ingredients <= max_ingredients:
+            raise CommandError('Некорректные границы числа ингредиентов.')
+
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        if len(ingredient_ids) < max_ingredients:
+            raise CommandError(
+                'Недостаточно ингредиентов, сначала выполните load_data.')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            if kwargs['clear']:
+                self.clear()
+            tag_ids = self.get_tag_ids()
+            user_ids = self.create_users()
+            recipe_ids = self.create_recipes(user_ids)
+            self.create_recipe_ingredients(
+                recipe_ids, ingredient_ids, min_ingredients, max_ingredients)
+            self.create_recipe_tags(recipe_ids, tag_ids)
+            self.create_pairs(
+                Favorite, user_ids, recipe_ids, kwargs['favorites'])
+            cart_user_ids = self.create_pairs(
+                ShoppingCart, user_ids, recipe_ids, kwargs['carts'])
+            self.create_subscriptions(user_ids)
+            for batch in chunked(cart_user_ids, self.batch_size):
+                rebuild_shopping_lists(batch)
+            if recipe_ids:
+                update_search_vectors_in_batches(
+                    Recipe.objects.filter(id__gte=recipe_ids[0]),
+                    self.batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.2f} с. '
+            f'Пароль пользователей: {kwargs["password"]}'))
+
+    def report(self, name, count, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{name}: {count} строк за {elapsed:.2f} с '
+            f'({count / max(elapsed, 1e-6):.0f} строк/с)')
+
+    def clear(self):
+        """
+        Удаляет пользователей с префиксом текущего запуска.
+        """
+        deleted, _ = User.objects.filter(
+            username__startswith=f'{self.options["prefix"]}_').delete()
+        self.stdout.write(f'Удалено объектов: {deleted}')
+
+    def get_tag_ids(self):
+        """
+        Возвращает id тегов, создавая стандартные, если тегов нет.
+        """
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS)
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self):
+        """
+        Создаёт пользователей и возвращает их id в порядке создания.
+        """
+        prefix = self.options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом "{prefix}" уже существуют, '
+                f'используйте --clear или другой --prefix.')
+        started = time.monotonic()
+        password = make_password(self.options['password'])
+        last_id = User.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        User.objects.bulk_create(
+            (User(username=f'{prefix}_{number}',
+                  email=f'{prefix}_{number}@example.com',
+                  first_name=f'Имя{number}',
+                  last_name=f'Фамилия{number}',
+                  password=password)
+             for number in range(self.options['users'])),
+            batch_size=self.batch_size)
+        user_ids = list(User.objects.filter(id__gt=last_id)
+                        .order_by('id').values_list('id', flat=True))
+        self.report('Пользователи', len(user_ids), started)
+        return user_ids
+
+    def create_recipes(self, user_ids):
+        """
+        Создаёт рецепты, распределяя их по авторам по степенному закону,
+        и возвращает их id в порядке создания.
+        """
+        started = time.monotonic()
+        storage = Recipe._meta.get_field('image').storage
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (230, 180, 120)).save(buffer, 'PNG')
+        # Хранилище называет файлы по содержимому, поэтому повторный
+        # запуск использует уже сохранённую картинку.
+        placeholder = storage.save(
+            PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+
+        authors = user_ids[:]
+        self.rng.shuffle(authors)
+        author_weights = power_law_weights(len(authors), self.options['skew'])
+        last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        rng = self.rng
+        short_codes = self.short_codes(last_id + 1)
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=author_id,
+                    short_code=next(short_codes),
+                    name=(f'{rng.choice(ADJECTIVES).capitalize()} '
+                          f'{rng.choice(DISHES)} №{number}'),
+                    text=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                    cooking_time=rng.randint(5, 180),
+                    image=placeholder)
+             for number, author_id in enumerate(rng.choices(
+                 authors, cum_weights=author_weights,
+                 k=self.options['recipes']))),
+            batch_size=self.batch_size)
+        recipe_ids = list(Recipe.objects.filter(id__gt=last_id)
+                          .order_by('id').values_list('id', flat=True))
+        self.report('Рецепты', len(recipe_ids), started)
+        return recipe_ids
+
+    @staticmethod
+    def short_codes(start):
+        """
+        Генерирует короткие коды для номеров start, start + 1, ...
+        Умножение на нечётное число — биекция на 32-битных числах,
+        поэтому коды разных номеров не совпадают, а номера начинаются
+        после последнего id рецепта и не повторяются между запусками.
+        Коды, которые уже есть в БД (например, созданные
+        Recipe.generate_short_code), пропускаются.
+        """
+        existing = set(Recipe.objects.exclude(short_code=None)
+                       .values_list('short_code', flat=True).iterator())
+        number = start
+        while True:
+            code = format(number * SHORT_CODE_MULTIPLIER % 2 ** 32, '08x')
+            number += 1
+            if code not in existing:
+                yield code
+
+    def create_recipe_ingredients(self, recipe_ids, ingredient_ids,
+                                  min_ingredients, max_ingredients):
+        started = time.monotonic()
+        rng = self.rng
+        count = insert_rows(
+            RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'),
+            ((recipe_id, ingredient_id, rng.randint(1, 500))
+             for recipe_id in recipe_ids
+             for ingredient_id in rng.sample(
+                 ingredient_ids,
+                 rng.randint(min_ingredients, max_ingredients))),
+            self.batch_size)
+        self.report('Ингредиенты рецептов', count, started)
+
+    def create_recipe_tags(self, recipe_ids, tag_ids):
+        started = time.monotonic()
+        rng = self.rng
+        count = insert_rows(
+            Recipe.tags.through, ('recipe_id', 'tag_id'),
+            ((recipe_id, tag_id)
+             for recipe_id in recipe_ids
+             for tag_id in rng.sample(
+                 tag_ids, rng.randint(1, min(3, len(tag_ids))))),
+            self.batch_size)
+        self.report('Теги рецептов', count, started)
+
+    def create_pairs(self, model, user_ids, recipe_ids, average):
+        """
+        Создаёт связи пользователь — рецепт (избранное или корзину),
+        выбирая рецепты по степенному закону. Возвращает id
+        пользователей, получивших хотя бы одну связь.
+        """
+        started = time.monotonic()
+        if not recipe_ids or average < 1:
+            return []
+        rng = self.rng
+        recipes = recipe_ids[:]
+        rng.shuffle(recipes)
+        weights = power_law_weights(len(recipes), self.options['skew'])
+        owners = []
+
+        def pairs():
+            for user_id in user_ids:
+                count = min(rng.randint(0, 2 * average), len(recipes))
+                if not count:
+                    continue
+                owners.append(user_id)
+                chosen = set(rng.choices(
+                    recipes, cum_weights=weights, k=count))
+                for recipe_id in sorted(chosen):
+                    yield user_id, recipe_id
+
+        count = insert_rows(model, ('user_id', 'recipe_id'), pairs(),
+                            self.batch_size)
+        self.report(model._meta.verbose_name_plural, count, started)
+        return owners
+
+    def create_subscriptions(self, user_ids):
+        """
+        Создаёт подписки: популярные авторы получают больше подписчиков.
+        """
+        started = time.monotonic()
+        average = self.options['subscriptions']
+        if len(user_ids) < 2 or average < 1:
+            return
+        rng = self.rng
+        authors = user_ids[:]
+        rng.shuffle(authors)
+        weights = power_law_weights(len(authors), self.options['skew'])
+
+        def pairs():
+            for user_id in user_ids:
+                count = min(rng.randint(0, 2 * average), len(authors) - 1)
+                chosen = set(rng.choices(
+                    authors, cum_weights=weights, k=count))
+                chosen.discard(user_id)
+                for author_id in sorted(chosen):
+                    yield author_id, user_id
+
+        count = insert_rows(
+            User.subscribers.through,
+            ('from_customuser_id', 'to_customuser_id'),
+            pairs(), self.batch_size)
+        self.report('Подписки', count, started)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Recipe
+from api.search import search_is_supported, update_search_vectors_in_batches
+
+
+class Command(BaseCommand):
+    help = 'Заполняет поисковые векторы рецептов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество рецептов в одной пачке')
+        parser.add_argument('--only-missing', action='store_true',
+                            help='Обработать только рецепты без вектора')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        if not search_is_supported():
+            self.stdout.write(self.style.WARNING(
+                'Полнотекстовый поиск доступен только в PostgreSQL.'))
+            return
+
+        recipes = Recipe.objects.all()
+        if kwargs['only_missing']:
+            recipes = recipes.filter(search_vector__isnull=True)
+        updated = update_search_vectors_in_batches(recipes, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые векторы обновлены для {updated} рецептов.'))
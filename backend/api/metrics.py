@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .snapshots import ProcessSnapshotStore
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    'foodgram_http_request_duration_seconds': (
+        'Время обработки запроса.', DURATION_BUCKETS),
+    'foodgram_http_response_size_bytes': (
+        'Размер тела ответа (без потоковых ответов).', SIZE_BUCKETS),
+    'foodgram_db_queries_per_request': (
+        'Количество SQL-запросов на HTTP-запрос.', QUERY_BUCKETS),
+}
+COUNTERS = {
+    'foodgram_http_requests_total': 'Количество обработанных запросов.',
+    'foodgram_db_query_duration_seconds_total': (
+        'Суммарное время SQL-запросов.'),
+    'foodgram_cache_requests_total': 'Обращения к кэшам приложения.',
+}
+# Воркер считается живым, если обновлял снимок не реже этого числа
+# интервалов сохранения.
+LIVE_WORKER_INTERVALS = 3
+
+
+class Metrics:
+    """
+    Метрики процесса: счётчики и гистограммы с метками. Процесс
+    периодически сохраняет их в файловое хранилище снимков, а
+    эндпоинт /metrics суммирует снимки всех воркеров.
+    """
+
+    def __init__(self, directory, flush_interval):
+        self.store = ProcessSnapshotStore(directory, 'metrics',
+                                          merge=merge_snapshots)
+        self.flush_interval = flush_interval
+        self.started = time.time()
+        self.last_flush = 0.0
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            buckets = HISTOGRAMS[name][1]
+            histogram = self.histograms[key] = [[0] * len(buckets), 0, 0]
+        for index, bound in enumerate(HISTOGRAMS[name][1]):
+            if value <= bound:
+                histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def observe_request(self, view, method, status, duration, size,
+                        query_count, query_time):
+        """
+        Учитывает обработанный HTTP-запрос.
+        """
+        labels = {'view': view, 'method': method}
+        with self.lock:
+            self.increment('foodgram_http_requests_total',
+                           dict(labels, status=str(status)))
+            self.observe('foodgram_http_request_duration_seconds',
+                         labels, duration)
+            if size is not None:
+                self.observe('foodgram_http_response_size_bytes',
+                             labels, size)
+            self.observe('foodgram_db_queries_per_request',
+                         labels, query_count)
+            self.increment('foodgram_db_query_duration_seconds_total',
+                           labels, query_time)
+        self.maybe_flush()
+
+    def record_cache(self, cache, hits, misses):
+        """
+        Учитывает попадания и промахи кэша cache.
+        """
+        with self.lock:
+            if hits:
+                self.increment('foodgram_cache_requests_total',
+                               {'cache': cache, 'result': 'hit'}, hits)
+            if misses:
+                self.increment('foodgram_cache_requests_total',
+                               {'cache': cache, 'result': 'miss'}, misses)
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        with self.lock:
+            data = dict(serialize_snapshot(self.counters, self.histograms),
+                        started=self.started)
+        self.store.write(data)
+
+    def collect(self):
+        """
+        Суммирует снимки воркеров и архив завершившихся воркеров, поэтому
+        счётчики и гистограммы не уменьшаются при перезапуске воркеров.
+        Количество и время запуска воркеров считаются только по живым.
+        """
+        self.flush()
+        counters = {}
+        histograms = {}
+        workers = []
+        live_after = time.time() - self.flush_interval * LIVE_WORKER_INTERVALS
+        for snapshot in self.store.read_all():
+            data = snapshot['data']
+            if (snapshot['updated_at'] >= live_after
+                    or snapshot['pid'] == os.getpid()):
+                workers.append((snapshot['pid'], data['started']))
+            add_snapshot(counters, histograms, data)
+        archive = self.store.read_archive()
+        if archive is not None:
+            add_snapshot(counters, histograms, archive)
+        return counters, histograms, sorted(workers)
+
+    def render(self):
+        """
+        Возвращает метрики в текстовом формате Prometheus.
+        """
+        counters, histograms, workers = self.collect()
+        lines = []
+        for name, description in COUNTERS.items():
+            lines += [f'# HELP {name} {description}',
+                      f'# TYPE {name} counter']
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        lines += ['# HELP foodgram_cache_hit_ratio '
+                  'Доля попаданий в кэш с момента запуска.',
+                  '# TYPE foodgram_cache_hit_ratio gauge']
+        for cache, ratio in sorted(cache_hit_ratios(counters).items()):
+            lines.append(
+                f'foodgram_cache_hit_ratio'
+                f'{format_labels((("cache", cache),))} {ratio:.6f}')
+        for name, (description, bounds) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {description}',
+                      f'# TYPE {name} histogram']
+            for (metric, labels), (buckets, total, count) in sorted(
+                    histograms.items()):
+                if metric != name:
+                    continue
+                for bound, value in zip(bounds, buckets):
+                    lines.append(
+                        f'{name}_bucket'
+                        f'{format_labels(labels + (("le", str(bound)),))} '
+                        f'{value}')
+                lines.append(
+                    f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))}'
+                    f' {count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {total}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+        lines += ['# HELP foodgram_workers Количество живых воркеров.',
+                  '# TYPE foodgram_workers gauge',
+                  f'foodgram_workers {len(workers)}',
+                  '# HELP foodgram_worker_start_time_seconds '
+                  'Время запуска воркера.',
+                  '# TYPE foodgram_worker_start_time_seconds gauge']
+        for pid, started in workers:
+            lines.append(
+                f'foodgram_worker_start_time_seconds'
+                f'{format_labels((("pid", str(pid)),))} {started}')
+        return '\n'.join(lines) + '\n'
+
+
+def add_snapshot(counters, histograms, data):
+    """
+    Добавляет счётчики и гистограммы снимка data к накопленным.
+    """
+    for name, labels, value in data['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, buckets, total, count in data['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        current = histograms.get(key)
+        if current is None:
+            histograms[key] = [list(buckets), total, count]
+        else:
+            current[0] = [a + b for a, b in zip(current[0], buckets)]
+            current[1] += total
+            current[2] += count
+
+
+def serialize_snapshot(counters, histograms):
+    return {
+        'counters': [[name, labels, value] for (name, labels), value
+                     in counters.items()],
+        'histograms': [[name, labels, *histogram]
+                       for (name, labels), histogram in histograms.items()],
+    }
+
+
+def merge_snapshots(archive, data):
+    """
+    Добавляет счётчики и гистограммы завершившегося воркера в архив.
+    """
+    counters = {}
+    histograms = {}
+    add_snapshot(counters, histograms, archive)
+    add_snapshot(counters, histograms, data)
+    return serialize_snapshot(counters, histograms)
+
+
+def cache_hit_ratios(counters):
+    """
+    Считает долю попаданий для каждого кэша.
+    """
+    totals = {}
+    for (name, labels), value in counters.items():
+        if name != 'foodgram_cache_requests_total':
+            continue
+        labels = dict(labels)
+        hits, requests = totals.get(labels['cache'], (0, 0))
+        if labels['result'] == 'hit':
+            hits += value
+        totals[labels['cache']] = (hits, requests + value)
+    return {cache: hits / requests
+            for cache, (hits, requests) in totals.items() if requests}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        f'{key}="{escape_label(value)}"' for key, value in labels)
+
+
+def escape_label(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+metrics = Metrics(settings.STATS_DIR, settings.STATS_FLUSH_INTERVAL)
@@ -0,0 +1,162 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import metrics
+from .query_stats import query_stats
+
+logger = logging.getLogger('api.performance')
+
+SLOW_QUERY_SQL_LENGTH = 500
+
+
+class RequestTiming:
+    """
+    Замеры одного запроса: время SQL-запросов (через execute_wrapper),
+    представления и рендеринга ответа.
+    """
+
+    def __init__(self, collect_queries=False):
+        self.started = time.perf_counter()
+        self.view_name = None
+        self.queries = [] if collect_queries else None
+        self.view_started = None
+        self.view_finished = None
+        self.render_finished = None
+        self.finished = None
+        self.query_count = 0
+        self.query_time = 0.0
+        self.slowest_query = None
+        self.slowest_query_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.query_count += 1
+            self.query_time += duration
+            if self.queries is not None:
+                self.queries.append((sql, duration))
+            if duration > self.slowest_query_time:
+                self.slowest_query_time = duration
+                self.slowest_query = sql
+
+    @property
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def view(self):
+        if self.view_started is None:
+            return 0.0
+        return ((self.view_finished or self.finished or time.perf_counter())
+                - self.view_started)
+
+    @property
+    def render(self):
+        if self.view_finished is None or self.render_finished is None:
+            return 0.0
+        return self.render_finished - self.view_finished
+
+    def server_timing(self):
+        """
+        Возвращает значение заголовка Server-Timing.
+        """
+        return ', '.join((
+            f'db;dur={self.query_time * 1000:.1f};'
+            f'desc="{self.query_count} queries"',
+            f'view;dur={self.view * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+class RequestTimingMiddleware:
+    """
+    Измеряет количество и время SQL-запросов, время представления
+    и рендеринга каждого запроса.
+
+    Для сотрудников и доли запросов REQUEST_TIMING_SAMPLE_RATE замеры
+    отдаются в заголовке Server-Timing. Запросы дольше
+    SLOW_REQUEST_THRESHOLD_MS или с числом SQL-запросов больше
+    SLOW_REQUEST_QUERY_THRESHOLD пишутся в лог api.performance
+    вместе с самым медленным SQL-запросом. При QUERY_STATS_ENABLED
+    запросы передаются в накопитель статистики по отпечаткам,
+    при METRICS_ENABLED замеры учитываются в метриках /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        self.slow_threshold = settings.SLOW_REQUEST_THRESHOLD_MS / 1000
+        self.query_threshold = settings.SLOW_REQUEST_QUERY_THRESHOLD
+        self.collect_queries = settings.QUERY_STATS_ENABLED
+        self.collect_metrics = settings.METRICS_ENABLED
+
+    def __call__(self, request):
+        timing = request.timing = RequestTiming(self.collect_queries)
+        sampled = random.random() < self.sample_rate
+        with connection.execute_wrapper(timing):
+            response = self.get_response(request)
+        timing.finished = time.perf_counter()
+
+        if sampled or self.is_staff(request):
+            response['Server-Timing'] = timing.server_timing()
+        if (timing.total > self.slow_threshold
+                or timing.query_count > self.query_threshold):
+            self.log_slow_request(request, response, timing)
+        if timing.queries:
+            query_stats.record(
+                f'{request.method} {timing.view_name or "-"}',
+                timing.queries)
+        if self.collect_metrics:
+            metrics.observe_request(
+                timing.view_name or '-', request.method,
+                response.status_code, timing.total,
+                None if response.streaming else len(response.content),
+                timing.query_count, timing.query_time)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = request.timing
+        timing.view_started = time.perf_counter()
+        match = request.resolver_match
+        timing.view_name = match.view_name or match._func_path
+
+    def process_template_response(self, request, response):
+        """
+        Вызывается после представления и до рендеринга ответа
+        (в том числе Response из DRF), поэтому отделяет время
+        рендеринга от времени представления.
+        """
+        timing = request.timing
+        timing.view_finished = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: self.render_finished(timing))
+        return response
+
+    @staticmethod
+    def render_finished(timing):
+        timing.render_finished = time.perf_counter()
+
+    @staticmethod
+    def is_staff(request):
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_staff)
+
+    def log_slow_request(self, request, response, timing):
+        slowest_query = timing.slowest_query or ''
+        logger.warning(
+            'Медленный запрос %s %s: статус %s, всего %.1f мс, '
+            'представление %.1f мс, рендеринг %.1f мс, '
+            'SQL %d запросов за %.1f мс, самый медленный %.1f мс: %s',
+            request.method, request.get_full_path(), response.status_code,
+            timing.total * 1000, timing.view * 1000, timing.render * 1000,
+            timing.query_count, timing.query_time * 1000,
+            timing.slowest_query_time * 1000,
+            slowest_query[:SLOW_QUERY_SQL_LENGTH])
@@ -0,0 +1,59 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_rows(model, owner_field, duplicate_ids, keep_id):
+    """
+    Переносит строки model с дубликатов ингредиента на keep_id,
+    складывая количества в пределах одного владельца.
+    """
+    kept = {}
+    for row in model.objects.filter(
+            ingredient_id__in=[keep_id, *duplicate_ids]).order_by('id'):
+        owner_id = getattr(row, f'{owner_field}_id')
+        target = kept.get(owner_id)
+        if target is None:
+            if row.ingredient_id != keep_id:
+                row.ingredient_id = keep_id
+                row.save(update_fields=['ingredient'])
+            kept[owner_id] = row
+        else:
+            target.amount += row.amount
+            target.save(update_fields=['amount'])
+            row.delete()
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('api', 'Ingredient')
+    RecipeIngredient = apps.get_model('api', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('api', 'ShoppingListItem')
+    groups = (
+        Ingredient.objects
+        .values('name', 'measurement_unit')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for group in groups:
+        duplicate_ids = list(
+            Ingredient.objects
+            .filter(name=group['name'],
+                    measurement_unit=group['measurement_unit'])
+            .exclude(id=group['keep_id'])
+            .values_list('id', flat=True))
+        merge_rows(RecipeIngredient, 'recipe', duplicate_ids,
+                   group['keep_id'])
+        merge_rows(ShoppingListItem, 'user', duplicate_ids, group['keep_id'])
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
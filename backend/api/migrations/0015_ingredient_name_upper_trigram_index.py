@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Поиск по вхождению (icontains) в PostgreSQL сравнивает
+# UPPER(name::text) LIKE UPPER(...), поэтому индексу по name из 0009
+# он не подходит и весь фильтр с OR выполнялся полным просмотром.
+UPPER_TRIGRAM_INDEXES = (
+    ('api_ingredient_name_upper_trgm', 'api_ingredient', 'name'),
+)
+
+
+def create_upper_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in UPPER_TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} '
+            f'ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)')
+
+
+def drop_upper_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in UPPER_TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_data_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_trigram_indexes,
+                             drop_upper_trigram_indexes),
+    ]
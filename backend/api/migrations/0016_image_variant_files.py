@@ -0,0 +1,64 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:43
+
+from django.db import migrations, models
+
+# Модель и JSON-поле вариантов её изображения.
+VARIANT_FIELDS = (
+    ('api', 'Recipe', 'image_variants'),
+    ('users', 'CustomUser', 'avatar_variants'),
+)
+
+
+def fill_variant_files(apps, schema_editor):
+    ImageVariantFile = apps.get_model('api', 'ImageVariantFile')
+    for app_label, model_name, variants_field in VARIANT_FIELDS:
+        model = apps.get_model(app_label, model_name)
+        rows = (model.objects.exclude(**{variants_field: {}})
+                .values_list('pk', variants_field).iterator())
+        batch = []
+        for pk, variants in rows:
+            for names in (variants or {}).values():
+                if not isinstance(names, dict):
+                    continue
+                batch.extend(
+                    ImageVariantFile(name=name, object_id=pk,
+                                     model_label=f'{app_label}.{model_name}')
+                    for name in names.values())
+            if len(batch) >= 2000:
+                ImageVariantFile.objects.bulk_create(batch)
+                batch = []
+        ImageVariantFile.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_ingredient_name_upper_trigram_index'),
+        ('users', '0005_avatar_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariantFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=255, verbose_name='Файл')),
+                ('model_label', models.CharField(max_length=64, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+            ],
+            options={
+                'verbose_name': 'Файл варианта изображения',
+                'verbose_name_plural': 'Файлы вариантов изображений',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='recipes/images/', verbose_name='Картинка'),
+        ),
+        migrations.AddIndex(
+            model_name='imagevariantfile',
+            index=models.Index(fields=['model_label', 'object_id'], name='api_variant_object_idx'),
+        ),
+        migrations.RunPython(fill_variant_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_data_version
+from .constants import REFERENCE_DATA_MAX_AGE, REFERENCE_SNAPSHOT_TTL
+from .metrics import metrics
+
+
+class ReferenceSnapshot:
+    """
+    Снимок справочника одной версии: готовые JSON-ответы списка
+    и отдельных записей вместе с их ETag.
+    """
+
+    def __init__(self, items, version):
+        self.version = version
+        self.last_modified = int(version[1])
+        self.built_at = time.monotonic()
+        self.by_id = {item['id']: item for item in items}
+        self.list = self.render(items)
+        self.details = {}
+
+    @staticmethod
+    def render(data):
+        body = JSONRenderer().render(data)
+        return body, '"%s"' % hashlib.sha1(body).hexdigest()
+
+    def is_fresh(self, version):
+        """
+        Проверяет, что снимок построен для версии version и не старше
+        REFERENCE_SNAPSHOT_TTL (на случай изменений в обход сигналов,
+        например queryset.update()).
+        """
+        return (self.version == version and time.monotonic() - self.built_at
+                < REFERENCE_SNAPSHOT_TTL)
+
+    def get_detail(self, pk):
+        """
+        Возвращает готовый ответ для записи pk или None.
+        """
+        detail = self.details.get(pk)
+        if detail is None and pk in self.by_id:
+            detail = self.details[pk] = self.render(self.by_id[pk])
+        return detail
+
+
+class ReferenceDataMixin:
+    """
+    Миксин для ReadOnlyModelViewSet почти неизменных справочников.
+
+    Полный список и отдельные записи отдаются готовым JSON из снимка
+    в памяти процесса. Снимок перестраивается, когда меняется версия
+    данных data_version_name в БД (см. bump_data_version), и не реже
+    раза в REFERENCE_SNAPSHOT_TTL секунд. Ответы содержат
+    ETag, Last-Modified и Cache-Control, условные запросы получают
+    304 Not Modified.
+    """
+
+    data_version_name = None
+    cache_max_age = REFERENCE_DATA_MAX_AGE
+
+    _snapshots = {}
+    _lock = threading.Lock()
+
+    def get_reference_items(self):
+        """
+        Возвращает все записи справочника в порядке вывода.
+        """
+        return self.get_serializer(self.get_queryset(), many=True).data
+
+    def get_snapshot(self):
+        """
+        Возвращает снимок текущей версии справочника.
+        """
+        version = get_data_version(self.data_version_name)
+        snapshot = self._snapshots.get(self.data_version_name)
+        hit = snapshot is not None and snapshot.is_fresh(version)
+        metrics.record_cache(self.data_version_name, int(hit), int(not hit))
+        if not hit:
+            with self._lock:
+                snapshot = self._snapshots.get(self.data_version_name)
+                if snapshot is None or not snapshot.is_fresh(version):
+                    snapshot = ReferenceSnapshot(
+                        self.get_reference_items(), version)
+                    self._snapshots[self.data_version_name] = snapshot
+        return snapshot
+
+    def snapshot_response(self, request, snapshot, rendered):
+        """
+        Возвращает готовый ответ или 304, если у клиента актуальная копия.
+        """
+        body, etag = rendered
+        response = get_conditional_response(
+            request, etag=etag, last_modified=snapshot.last_modified)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(snapshot.last_modified)
+        patch_cache_control(response, public=True,
+                            max_age=self.cache_max_age)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Отдаёт полный список из снимка, запросы с параметрами
+        обрабатываются как обычно.
+        """
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        snapshot = self.get_snapshot()
+        return self.snapshot_response(request, snapshot, snapshot.list)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Отдаёт запись из снимка.
+        """
+        snapshot = self.get_snapshot()
+        try:
+            rendered = snapshot.get_detail(int(kwargs[self.lookup_field]))
+        except ValueError:
+            rendered = None
+        if rendered is None:
+            raise NotFound
+        return self.snapshot_response(request, snapshot, rendered)
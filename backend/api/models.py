@@ -2,15 +2,17 @@ import uuid
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.urls import reverse
 
 from .constants import (AMOUNT_MIN_VALUE, COOKING_MIN_TIME,
                         INGREDIENT_NAME_LENGTH, INGREDIENT_UNIT_LENGTH,
                         MAX_POSITIVE_VALUE, RECIPE_CODE_LENGTH,
-                        RECIPE_NAME_LENGTH, TAG_MAX_LENGTH)
+                        RECIPE_NAME_LENGTH, SHORT_CODE_ATTEMPTS,
+                        TAG_MAX_LENGTH)
 
 User = get_user_model()
 
@@ -67,6 +69,7 @@ class Ingredient(models.Model):
         и добавляющий уникальность комбинации названия и единицы измерения.
         """
         ordering = ['name']
+        unique_together = ('name', 'measurement_unit')
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -93,7 +96,8 @@ class Recipe(models.Model):
         Tag,
         verbose_name='Теги',
         blank=True)
-    image = models.ImageField('Картинка', upload_to='recipes/images/')
+    image = models.ImageField(
+        'Картинка', upload_to='recipes/images/', db_index=True)
     name = models.CharField('Название', max_length=RECIPE_NAME_LENGTH)
     text = models.TextField('Описание', blank=False)
     cooking_time = models.PositiveSmallIntegerField(
@@ -115,6 +119,15 @@ class Recipe(models.Model):
         unique=True,
         blank=True,
         null=True)
+    image_variants = models.JSONField(
+        'Варианты картинки',
+        default=dict,
+        blank=True,
+        editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False)
 
     class Meta:
         """
@@ -129,11 +142,23 @@ class Recipe(models.Model):
 
     def save(self, *args, **kwargs):
         """
-        Сохраняет короткий код.
+        Сохраняет рецепт, генерируя короткий код. Если код совпал
+        с уже существующим, сохранение повторяется в точке сохранения
+        с новым кодом.
         """
-        if not self.short_code:
+        if self.short_code:
+            return super().save(*args, **kwargs)
+        for attempt in range(1, SHORT_CODE_ATTEMPTS + 1):
             self.short_code = self.generate_short_code()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if (attempt == SHORT_CODE_ATTEMPTS
+                        or not Recipe.objects.filter(
+                            short_code=self.short_code).exists()):
+                    self.short_code = None
+                    raise
 
     def generate_short_code(self):
         """
@@ -241,3 +266,77 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил в корзину {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Агрегированный список покупок пользователя: суммарное количество
+    каждого ингредиента по всем рецептам в корзине. Обновляется
+    инкрементально при изменении корзины и ингредиентов рецептов.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list')
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items')
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        """
+        Мета-класс для модели ShoppingListItem, указывающий уникальность
+        комбинации пользователя и ингредиента.
+        """
+        ordering = ['id']
+        unique_together = ('user', 'ingredient')
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class DataVersion(models.Model):
+    """
+    Версия набора данных (справочника тегов, ингредиентов): счётчик,
+    который увеличивается в той же транзакции, что и изменение данных.
+    По нему все процессы определяют, что кэши в памяти устарели.
+    """
+
+    name = models.CharField('Набор данных', max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField('Версия', default=1)
+    updated = models.DateTimeField('Изменён', auto_now=True)
+
+    class Meta:
+        """
+        Мета-класс для модели DataVersion.
+        """
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+class ImageVariantFile(models.Model):
+    """
+    Файл уменьшенной копии картинки рецепта или аватара и объект,
+    который на него ссылается. Дублирует имена из JSON-полей вариантов,
+    чтобы проверка ссылок перед удалением файла была поиском по индексу.
+    """
+
+    name = models.CharField('Файл', max_length=255, db_index=True)
+    model_label = models.CharField('Модель', max_length=64)
+    object_id = models.BigIntegerField('id объекта')
+
+    class Meta:
+        """
+        Мета-класс для модели ImageVariantFile.
+        """
+        indexes = [models.Index(fields=['model_label', 'object_id'],
+                                name='api_variant_object_idx')]
+        verbose_name = 'Файл варианта изображения'
+        verbose_name_plural = 'Файлы вариантов изображений'
+
+    def __str__(self):
+        return self.name
@@ -1,11 +1,59 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CustomCursorPagination(CursorPagination):
+    """
+    Курсорный пагинатор без подсчёта общего количества элементов.
+    Позиция курсора строится по сортировке модели из Meta.ordering
+    (для рецептов это '-id'), поэтому глубокие страницы не используют OFFSET.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Возвращает сортировку модели queryset.
+        """
+        return tuple(queryset.model._meta.ordering or (self.ordering,))
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     """
     Кастомный пагинатор, позволяющий ограничивать
     количество элементов на странице.
+
+    Если в запросе передан параметр cursor (в том числе пустой),
+    пагинация выполняется курсорным пагинатором. Курсор строится по
+    сортировке модели, поэтому queryset с другой сортировкой
+    (например, результаты поиска по релевантности) всегда разбивается
+    на страницы по номерам.
     """
 
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_pagination_class = CustomCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Выбирает режим пагинации по параметрам запроса.
+        """
+        self.cursor_paginator = None
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_param in request.query_params:
+            cursor_paginator = self.cursor_pagination_class()
+            ordering = cursor_paginator.get_ordering(request, queryset, view)
+            if tuple(queryset.query.order_by or ordering) == ordering:
+                self.cursor_paginator = cursor_paginator
+                return cursor_paginator.paginate_queryset(
+                    queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """
+        Возвращает ответ в формате выбранного режима пагинации.
+        """
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
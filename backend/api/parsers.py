@@ -0,0 +1,45 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class JSONFormData(dict):
+    """
+    Данные из JSON-поля data. Request.data дополняет их файлами из
+    MultiValueDict; в словарь при этом попадает по одному файлу
+    на поле, а не списки.
+    """
+
+    def copy(self):
+        return type(self)(self)
+
+    def update(self, other=(), **kwargs):
+        if isinstance(other, MultiValueDict):
+            other = other.dict()
+        super().update(other, **kwargs)
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """
+    Парсер multipart/form-data, в котором вложенные данные передаются
+    JSON-документом в поле data, а изображения — файлами:
+
+        data={"name": "...", "tags": [1], "ingredients": [...]}
+        image=<файл>
+
+    Без поля data форма разбирается как обычно.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        if 'data' not in result.data:
+            return result
+        try:
+            data = json.loads(result.data['data'])
+        except ValueError as error:
+            raise ParseError(f'Поле data содержит неверный JSON: {error}')
+        if not isinstance(data, dict):
+            raise ParseError('Поле data должно быть JSON-объектом.')
+        return DataAndFiles(JSONFormData(data), result.files)
@@ -0,0 +1,158 @@
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from .snapshots import ProcessSnapshotStore
+
+SORT_FIELDS = ('total', 'count', 'max', 'mean')
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_placeholder_list = re.compile(
+    r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_values_rows = re.compile(r'(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+_whitespace = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """
+    Нормализует SQL-запрос: заменяет литералы на ?, списки
+    параметров IN (...) и многострочные VALUES сворачивает,
+    чтобы запросы, отличающиеся только значениями, совпадали.
+    """
+    sql = _string_literal.sub('?', sql)
+    sql = _number_literal.sub('?', sql)
+    sql = _placeholder_list.sub('(...)', sql)
+    sql = _values_rows.sub(r'\1', sql)
+    return _whitespace.sub(' ', sql).strip()
+
+
+def merge_entries(*snapshots):
+    """
+    Объединяет статистику нескольких снимков по паре
+    (представление, отпечаток).
+    """
+    merged = {}
+    for entries in snapshots:
+        for entry in entries:
+            key = (entry['view'], entry['fingerprint'])
+            current = merged.get(key)
+            if current is None:
+                merged[key] = dict(entry)
+            else:
+                current['count'] += entry['count']
+                current['total'] += entry['total']
+                current['max'] = max(current['max'], entry['max'])
+    return list(merged.values())
+
+
+class QueryStats:
+    """
+    Накопитель статистики SQL-запросов процесса по паре
+    (представление, отпечаток запроса): количество вызовов,
+    суммарное и максимальное время.
+
+    Процесс сервера периодически сохраняет снимок в файл
+    queries-<host>-<pid>.json каталога STATS_DIR, а отчёты объединяют
+    снимки всех процессов.
+    """
+
+    def __init__(self, directory, flush_interval):
+        self.store = ProcessSnapshotStore(directory, 'queries',
+                                          merge=merge_entries)
+        self.flush_interval = flush_interval
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.last_flush = 0.0
+
+    def record(self, view, queries):
+        """
+        Добавляет запросы одного HTTP-запроса: список пар
+        (SQL, длительность в секундах).
+        """
+        with self.lock:
+            for sql, duration in queries:
+                key = (view, fingerprint(sql))
+                entry = self.entries.get(key)
+                if entry is None:
+                    self.entries[key] = [1, duration, duration]
+                else:
+                    entry[0] += 1
+                    entry[1] += duration
+                    if duration > entry[2]:
+                        entry[2] = duration
+        if time.monotonic() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                {'view': view, 'fingerprint': sql, 'count': count,
+                 'total': total, 'max': maximum}
+                for (view, sql), (count, total, maximum)
+                in self.entries.items()
+            ]
+
+    def flush(self):
+        """
+        Сохраняет снимок процесса. Если после запуска процесса
+        статистику сбросили, накопленные данные очищаются.
+        """
+        self.last_flush = time.monotonic()
+        if self.store.reset_time() > self.started:
+            with self.lock:
+                self.entries.clear()
+                self.started = time.time()
+        self.store.write(self.snapshot())
+
+    def reset(self):
+        """
+        Сбрасывает статистику всех процессов.
+        """
+        self.store.reset()
+        with self.lock:
+            self.entries.clear()
+            self.started = time.time()
+
+    def load(self):
+        """
+        Возвращает объединённую статистику всех процессов, включая
+        архив завершившихся.
+        """
+        if self.entries:
+            self.flush()
+        return merge_entries(
+            self.store.read_archive() or [],
+            *(snapshot['data'] for snapshot in self.store.read_all()))
+
+    def top(self, limit=20, sort='total', view=None, by_view=True):
+        """
+        Возвращает limit самых тяжёлых отпечатков. При by_view=False
+        статистика представлений одного отпечатка суммируется.
+        """
+        entries = self.load()
+        if view:
+            entries = [entry for entry in entries if entry['view'] == view]
+        if not by_view:
+            grouped = {}
+            for entry in entries:
+                current = grouped.get(entry['fingerprint'])
+                if current is None:
+                    grouped[entry['fingerprint']] = dict(entry, view=None)
+                else:
+                    current['count'] += entry['count']
+                    current['total'] += entry['total']
+                    current['max'] = max(current['max'], entry['max'])
+            entries = list(grouped.values())
+        for entry in entries:
+            entry['mean'] = entry['total'] / entry['count']
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        return entries[:limit]
+
+
+query_stats = QueryStats(settings.STATS_DIR, settings.STATS_FLUSH_INTERVAL)
@@ -0,0 +1,60 @@
+from functools import cached_property
+
+from django.contrib.auth.models import AnonymousUser
+
+
+class UserRelations:
+    """
+    Связи текущего пользователя, загружаемые лениво один раз за запрос:
+    id авторов, на которых он подписан, и id рецептов в избранном
+    и в корзине покупок.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def subscriptions(self):
+        """
+        Возвращает множество id авторов, на которых подписан пользователь.
+        """
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            self.user.subscribed_to.values_list('id', flat=True))
+
+    @cached_property
+    def favorites(self):
+        """
+        Возвращает множество id рецептов в избранном пользователя.
+        """
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            self.user.favorites.values_list('recipe_id', flat=True))
+
+    @cached_property
+    def shopping_cart(self):
+        """
+        Возвращает множество id рецептов в корзине покупок пользователя.
+        """
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            self.user.shopping_cart.values_list('recipe_id', flat=True))
+
+
+def get_user_relations(request):
+    """
+    Возвращает объект UserRelations текущего запроса, создавая его
+    при первом обращении. Объект хранится в HttpRequest, поэтому
+    общий для всех сериализаторов запроса.
+    """
+    if request is None:
+        return UserRelations(AnonymousUser())
+    http_request = getattr(request, '_request', request)
+    relations = getattr(http_request, 'user_relations', None)
+    if relations is None or relations.user != request.user:
+        relations = UserRelations(request.user)
+        http_request.user_relations = relations
+    return relations
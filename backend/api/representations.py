@@ -0,0 +1,169 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+
+from .cache import (get_author_fragments, get_generations,
+                    get_recipe_fragments, set_author_fragments,
+                    set_recipe_fragments)
+from .images import get_variant_urls
+from .models import Recipe, RecipeIngredient
+from .relations import get_user_relations
+
+User = get_user_model()
+
+RECIPE_ROW_FIELDS = ('id', 'author_id')
+
+
+def get_storage_url(model, field_name, name):
+    """
+    Возвращает относительный URL файла по имени, сохранённому в БД,
+    не создавая объект модели.
+    """
+    if not name:
+        return None
+    return model._meta.get_field(field_name).storage.url(name)
+
+
+def build_absolute_url(request, url):
+    """
+    Возвращает абсолютный URL так же, как это делает ImageField.
+    """
+    if url is None or request is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
+def build_absolute_urls(request, urls):
+    """
+    Возвращает словарь URL вариантов изображения с абсолютными адресами.
+    """
+    return {key: build_absolute_url(request, url)
+            for key, url in urls.items()}
+
+
+def build_recipe_fragments(recipe_ids):
+    """
+    Строит не зависящую от пользователя часть рецептов из строк values(),
+    сгруппированных в Python, без создания объектов моделей.
+    """
+    tags = defaultdict(list)
+    for recipe_id, tag_id, name, slug in (
+            Recipe.tags.through.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by('tag__name')
+            .values_list('recipe_id', 'tag_id', 'tag__name', 'tag__slug')):
+        tags[recipe_id].append({'id': tag_id, 'name': name, 'slug': slug})
+
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, name, unit, amount in (
+            RecipeIngredient.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by('id')
+            .values_list('recipe_id', 'ingredient_id', 'ingredient__name',
+                         'ingredient__measurement_unit', 'amount')):
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+
+    return {
+        recipe_id: {
+            'id': recipe_id,
+            'tags': tags[recipe_id],
+            'ingredients': ingredients[recipe_id],
+            'name': name,
+            'image': get_storage_url(Recipe, 'image', image),
+            'image_variants': get_variant_urls(
+                Recipe._meta.get_field('image').storage, image_variants),
+            'text': text,
+            'cooking_time': cooking_time,
+        }
+        for recipe_id, name, image, image_variants, text, cooking_time in (
+            Recipe.objects
+            .filter(id__in=recipe_ids)
+            .order_by()
+            .values_list('id', 'name', 'image', 'image_variants', 'text',
+                         'cooking_time'))
+    }
+
+
+def build_author_fragments(author_ids):
+    """
+    Строит не зависящую от пользователя часть данных авторов из values().
+    """
+    return {
+        author_id: {
+            'id': author_id,
+            'username': username,
+            'email': email,
+            'first_name': first_name,
+            'last_name': last_name,
+            'avatar': get_storage_url(User, 'avatar', avatar),
+            'avatar_variants': get_variant_urls(
+                User._meta.get_field('avatar').storage, avatar_variants),
+        }
+        for (author_id, username, email, first_name, last_name, avatar,
+             avatar_variants) in (
+            User.objects
+            .filter(id__in=author_ids)
+            .order_by()
+            .values_list('id', 'username', 'email', 'first_name',
+                         'last_name', 'avatar', 'avatar_variants'))
+    }
+
+
+def _get_fragments(name, ids, get_cached, build, set_cached):
+    # Поколения читаются до построения фрагментов: если данные изменятся
+    # во время построения, фрагмент сохранится под устаревшим ключом.
+    generations = get_generations(name, ids)
+    fragments = get_cached(generations)
+    missing = [pk for pk in ids if pk not in fragments]
+    if missing:
+        created = build(missing)
+        set_cached(generations, created)
+        fragments.update(created)
+    return fragments
+
+
+def render_recipes(rows, request):
+    """
+    Возвращает представления рецептов для RecipeOutputSerializer.
+
+    rows — словари с ключами id и author_id. Фрагменты берутся из кэша,
+    недостающие строятся запросами values() и кэшируются. Флаги
+    пользователя берутся из связей запроса (get_user_relations).
+    """
+    relations = get_user_relations(request)
+    recipe_ids = list(dict.fromkeys(row['id'] for row in rows))
+    author_ids = list(dict.fromkeys(row['author_id'] for row in rows))
+    recipes = _get_fragments('recipe', recipe_ids, get_recipe_fragments,
+                             build_recipe_fragments, set_recipe_fragments)
+    authors = _get_fragments('author', author_ids, get_author_fragments,
+                             build_author_fragments, set_author_fragments)
+
+    result = []
+    for row in rows:
+        recipe = recipes[row['id']]
+        author = authors[row['author_id']]
+        result.append({
+            'id': recipe['id'],
+            'tags': recipe['tags'],
+            'author': dict(
+                author,
+                avatar=build_absolute_url(request, author['avatar']),
+                avatar_variants=build_absolute_urls(
+                    request, author['avatar_variants']),
+                is_subscribed=row['author_id'] in relations.subscriptions),
+            'ingredients': recipe['ingredients'],
+            'name': recipe['name'],
+            'image': build_absolute_url(request, recipe['image']),
+            'image_variants': build_absolute_urls(
+                request, recipe['image_variants']),
+            'text': recipe['text'],
+            'cooking_time': recipe['cooking_time'],
+            'is_favorited': row['id'] in relations.favorites,
+            'is_in_shopping_cart': row['id'] in relations.shopping_cart,
+        })
+    return result
@@ -0,0 +1,86 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery, TextField
+
+from .constants import SEARCH_CONFIG
+from .models import Recipe, RecipeIngredient
+
+SEARCH_FIELDS = frozenset(('name', 'text'))
+
+
+def search_is_supported(using='default'):
+    """
+    Полнотекстовый поиск доступен только в PostgreSQL.
+    """
+    return connections[using].vendor == 'postgresql'
+
+
+def get_search_vector():
+    """
+    Возвращает выражение поискового вектора рецепта: название (вес A),
+    описание (вес B) и названия ингредиентов (вес C).
+    """
+    ingredient_names = (
+        RecipeIngredient.objects
+        .filter(recipe_id=OuterRef('pk'))
+        .order_by()
+        .values('recipe_id')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('name', config=SEARCH_CONFIG, weight='A')
+        + SearchVector('text', config=SEARCH_CONFIG, weight='B')
+        + SearchVector(Subquery(ingredient_names, output_field=TextField()),
+                       config=SEARCH_CONFIG, weight='C')
+    )
+
+
+def update_search_vectors(recipe_ids=None):
+    """
+    Пересчитывает поисковые векторы рецептов одним UPDATE.
+    Без recipe_ids обновляет все рецепты. Возвращает число
+    обновлённых строк.
+    """
+    if not search_is_supported():
+        return 0
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    return recipes.update(search_vector=get_search_vector())
+
+
+def update_search_vectors_in_batches(recipes, batch_size):
+    """
+    Пересчитывает поисковые векторы рецептов из queryset recipes
+    пачками по batch_size. Пачка выбирается по диапазону id
+    (id__gt=last_id), поэтому запросы не содержат длинных списков id.
+    Возвращает число обновлённых строк.
+    """
+    if not search_is_supported():
+        return 0
+    recipes = recipes.order_by('id')
+    last_id = 0
+    updated = 0
+    while True:
+        batch = recipes.filter(id__gt=last_id).values_list(
+            'id', flat=True)[batch_size - 1:batch_size]
+        batch_last_id = next(iter(batch), None)
+        if batch_last_id is None:
+            return updated + recipes.filter(id__gt=last_id).update(
+                search_vector=get_search_vector())
+        updated += recipes.filter(
+            id__gt=last_id, id__lte=batch_last_id).update(
+                search_vector=get_search_vector())
+        last_id = batch_last_id
+
+
+def update_search_vectors_on_commit(recipe_ids):
+    """
+    Пересчитывает поисковые векторы после фиксации транзакции,
+    когда ингредиенты рецепта уже сохранены.
+    """
+    recipe_ids = list(recipe_ids)
+    if recipe_ids and search_is_supported():
+        transaction.on_commit(lambda: update_search_vectors(recipe_ids))
@@ -1,12 +1,20 @@
-import base64
-
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Manager
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 
+from . import shopping_list
+from .cache import invalidate_recipes_on_commit
 from .constants import AMOUNT_MIN_VALUE, COOKING_MIN_TIME, MAX_POSITIVE_VALUE
+from .images import get_variant_urls
 from .models import Ingredient, Recipe, RecipeIngredient, Tag
+from .relations import get_user_relations
+from .representations import render_recipes
+from .search import update_search_vectors_on_commit
+from .storage import ContentAddressedStorage
+from .uploads import ImageUploadError, decode_base64_image, prepare_image
 
 User = get_user_model()
 
@@ -14,23 +22,31 @@ User = get_user_model()
 class Base64ImageField(serializers.ImageField):
     """
     Кастомное поле для обработки изображений в формате Base64.
+    Принимает также файл, загруженный через multipart/form-data.
     """
 
     def to_internal_value(self, data):
         """
-        Преобразует Base64-данные в объект изображения.
+        Преобразует Base64-данные или загруженный файл в объект
+        изображения. Base64 декодируется во временный файл, формат
+        и размеры проверяются по заголовку, большие изображения
+        уменьшаются.
         """
         if not data:
             raise serializers.ValidationError('Это поле не может быть пустым.')
 
         try:
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
-        except Exception:
-            raise serializers.ValidationError('Неверный формат изображения.')
+            if isinstance(data, str):
+                data = decode_base64_image(data)
+            elif not isinstance(data, UploadedFile):
+                raise ImageUploadError('Неверный формат изображения.')
+            data = prepare_image(data)
+        except ImageUploadError as error:
+            raise serializers.ValidationError(str(error))
 
-        return super().to_internal_value(data)
+        # Изображение уже проверено prepare_image, поэтому повторное
+        # чтение файла в ImageField.to_internal_value не нужно.
+        return serializers.FileField.to_internal_value(self, data)
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -97,6 +113,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
     """
 
     id = serializers.IntegerField(read_only=True)
+    avatar_variants = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -105,17 +122,23 @@ class CustomUserSerializer(serializers.ModelSerializer):
         """
         model = User
         fields = ('id', 'username', 'email', 'first_name',
-                  'last_name', 'avatar', 'is_subscribed')
+                  'last_name', 'avatar', 'avatar_variants', 'is_subscribed')
         read_only_fields = ('id',)
 
+    def get_avatar_variants(self, obj):
+        """
+        Возвращает URL уменьшенных копий аватара.
+        """
+        return get_variant_urls(obj.avatar.storage, obj.avatar_variants,
+                                self.context.get('request'))
+
     def get_is_subscribed(self, obj):
         """
         Проверяет, подписан ли текущий пользователь на данного пользователя.
+        Подписки загружаются один раз за запрос.
         """
-        request = self.context['request']
-        if request and request.user.is_authenticated:
-            return obj.subscribers.filter(id=request.user.id).exists()
-        return False
+        return obj.id in get_user_relations(
+            self.context['request']).subscriptions
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -224,6 +247,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     def validate_ingredients(self, value):
         """
         Валидация ингредиентов, проверка на дубли и их наличие в базе данных.
+        Все ингредиенты проверяются одним запросом.
         """
         if not value:
             raise serializers.ValidationError('Ингредиенты обязательны.')
@@ -234,11 +258,16 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     f'Ингредиент с id {ingredient_id} дублируется.')
             unique_ingredient_ids.add(ingredient_id)
-            if not Ingredient.objects.filter(id=ingredient_id).exists():
-                raise serializers.ValidationError(
-                    f'Ингредиент с id {ingredient_id} не существует.')
+
+        existing_ingredients = Ingredient.objects.filter(
+            id__in=unique_ingredient_ids).values_list('id', flat=True)
+        missing_ingredients = unique_ingredient_ids - set(existing_ingredients)
+        if missing_ingredients:
+            raise serializers.ValidationError(
+                f'Ингредиенты с id {missing_ingredients} не существуют.')
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         """
         Создание рецепта и привязка ингредиентов и тегов.
@@ -251,9 +280,13 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """
         Обновление рецепта, ингредиентов и тегов.
+        Записываются только отличающиеся от текущих данные; если ничего
+        не изменилось, запросов на запись нет, а кэш рецепта не
+        сбрасывается. Картинка сравнивается по хэшу содержимого.
         """
         if 'tags' not in self.initial_data:
             raise serializers.ValidationError(
@@ -262,86 +295,149 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'ingredients': 'Это поле обязательно.'})
 
-        ingredients_data = validated_data.pop('ingredients', None)
-        tags_data = validated_data.pop('tags', None)
-
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time)
-
-        if 'image' in validated_data:
-            instance.image = validated_data.get('image', instance.image)
-
-        instance.save()
-
-        if ingredients_data is not None:
-            instance.recipe_ingredients.all().delete()
-            self._create_recipe_ingredients(instance, ingredients_data)
-
-        instance.tags.set(tags_data)
+        ingredients_data = validated_data.pop('ingredients')
+        tags_data = validated_data.pop('tags')
+        shopping_list.lock_recipe(instance.pk)
+
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if (not self._is_same_image(instance.image, value)
+                if field == 'image' else getattr(instance, field) != value)
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+
+        ingredient_deltas = self._update_recipe_ingredients(
+            instance, ingredients_data)
+        shopping_list.recipe_ingredients_changed(
+            instance.pk, ingredient_deltas)
+        self._update_recipe_tags(instance, tags_data)
         return instance
 
+    @staticmethod
+    def _is_same_image(field_file, upload):
+        """
+        Проверяет, что загруженная картинка совпадает с текущей.
+        Хранилище называет файлы по SHA-256 содержимого, поэтому
+        достаточно сравнить имя, которое получил бы загруженный файл.
+        """
+        storage = field_file.storage
+        return (bool(field_file)
+                and isinstance(storage, ContentAddressedStorage)
+                and storage.get_blob_name(upload.name, upload)
+                == field_file.name)
+
     def _create_recipe_ingredients(self, recipe, ingredients_data):
         """
         Утилита для создания объектов модели RecipeIngredient.
-        """
-        recipe_ingredients = []
-        for ingredient_data in ingredients_data:
-            ingredient = Ingredient.objects.get(id=ingredient_data['id'])
-            recipe_ingredients.append(
-                RecipeIngredient(
-                    recipe=recipe,
-                    ingredient=ingredient,
-                    amount=ingredient_data['amount']
-                )
+        Существование ингредиентов уже проверено в validate_ingredients,
+        поэтому связи создаются по id без дополнительных запросов.
+        """
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_data['id'],
+                amount=ingredient_data['amount']
             )
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+            for ingredient_data in ingredients_data
+        )
+        invalidate_recipes_on_commit([recipe.pk])
+
+    def _update_recipe_ingredients(self, recipe, ingredients_data):
+        """
+        Применяет к ингредиентам рецепта только необходимые вставки,
+        обновления и удаления. Возвращает изменения количества
+        в виде словаря {id ингредиента: разница}.
+        """
+        existing = {recipe_ingredient.ingredient_id: recipe_ingredient
+                    for recipe_ingredient in recipe.recipe_ingredients.all()}
+        amounts = {ingredient_data['id']: ingredient_data['amount']
+                   for ingredient_data in ingredients_data}
+
+        to_delete = [recipe_ingredient.id
+                     for ingredient_id, recipe_ingredient in existing.items()
+                     if ingredient_id not in amounts]
+        to_update = []
+        to_create = []
+        deltas = {ingredient_id: -recipe_ingredient.amount
+                  for ingredient_id, recipe_ingredient in existing.items()
+                  if ingredient_id not in amounts}
+        for ingredient_id, amount in amounts.items():
+            recipe_ingredient = existing.get(ingredient_id)
+            if recipe_ingredient is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount))
+                deltas[ingredient_id] = amount
+            elif recipe_ingredient.amount != amount:
+                deltas[ingredient_id] = amount - recipe_ingredient.amount
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if deltas:
+            invalidate_recipes_on_commit([recipe.pk])
+        if to_delete or to_create:
+            update_search_vectors_on_commit([recipe.pk])
+        return deltas
+
+    def _update_recipe_tags(self, recipe, tags_data):
+        """
+        Добавляет и удаляет только изменившиеся теги рецепта.
+        """
+        existing = set(recipe.tags.values_list('id', flat=True))
+        tags_data = set(tags_data)
+        if existing - tags_data:
+            recipe.tags.remove(*(existing - tags_data))
+        if tags_data - existing:
+            recipe.tags.add(*(tags_data - existing))
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """
+    Сериализатор списка рецептов, собирающий представления
+    всей страницы разом, чтобы обращаться к кэшу пачкой.
+    """
+
+    def to_representation(self, data):
+        """
+        Возвращает список представлений рецептов.
+        """
+        iterable = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representation_many(list(iterable))
 
 
-class RecipeOutputSerializer(serializers.ModelSerializer):
+class RecipeOutputSerializer(serializers.BaseSerializer):
     """
-    Сериализатор для вывода данных о рецепте.
+    Сериализатор для вывода данных о рецепте. Представления собирает
+    render_recipes из кэшированных фрагментов, формат полей описан там.
     """
 
-    ingredients = IngredientWithAmountSerializer(
-        source='recipe_ingredients', many=True)
-    tags = TagSerializer(many=True)
-    author = CustomUserSerializer()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
-
     class Meta:
         """
-        Мета-класс для модели Recipe, указывающий поля для сериализации.
+        Мета-класс, указывающий сериализатор списка рецептов.
         """
-        model = Recipe
-        fields = (
-            'id', 'tags', 'author', 'ingredients',
-            'name', 'image', 'text', 'cooking_time',
-            'is_favorited', 'is_in_shopping_cart'
-        )
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, obj):
+    def to_representation(self, instance):
         """
-        Проверяет, находится ли рецепт в избранном у текущего пользователя.
+        Возвращает представление одного рецепта.
         """
-        request = self.context['request']
-        user = request.user
-        if request and user.is_authenticated:
-            return obj.favorited_by.filter(user=user).exists()
-        return False
+        return self.to_representation_many([instance])[0]
 
-    def get_is_in_shopping_cart(self, obj):
+    def to_representation_many(self, recipes):
         """
-        Проверяет, находится ли рецепт в корзине покупок
-        у текущего пользователя.
+        Собирает представления рецептов через render_recipes.
         """
-        request = self.context['request']
-        user = request.user
-        if request and user.is_authenticated:
-            return obj.in_shopping_cart.filter(user=user).exists()
-        return False
+        rows = [{'id': recipe.pk, 'author_id': recipe.author_id}
+                for recipe in recipes]
+        return render_recipes(rows, self.context.get('request'))
 
 
 class SubRecipeSerializer(serializers.ModelSerializer):
@@ -349,12 +445,21 @@ class SubRecipeSerializer(serializers.ModelSerializer):
     Сериализатор для упрощённого вывода данных о рецепте.
     """
 
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         """
         Мета-класс для модели Recipe, указывающий поля для сериализации.
         """
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+    def get_image_variants(self, obj):
+        """
+        Возвращает URL уменьшенных копий картинки рецепта.
+        """
+        return get_variant_urls(obj.image.storage, obj.image_variants,
+                                self.context.get('request'))
 
 
 class SubscriptionsSerializer(CustomUserSerializer):
@@ -394,9 +499,13 @@ class SubscriptionsSerializer(CustomUserSerializer):
 
     def get_recipes(self, obj):
         """
-        Получает и сериализует все рецепты пользователя.
+        Получает и сериализует рецепты пользователя. Использует
+        загруженные заранее limited_recipes, иначе ограничивает выборку
+        значением recipes_limit из контекста.
         """
-        recipes = obj.recipes.all()
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()[:self.context.get('recipes_limit')]
         serializer = SubRecipeSerializer(
             recipes,
             many=True,
@@ -406,5 +515,8 @@ class SubscriptionsSerializer(CustomUserSerializer):
     def get_recipes_count(self, obj):
         """
         Возвращает количество рецептов у пользователя.
+        Использует аннотацию recipes_count, если она есть в queryset.
         """
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
@@ -0,0 +1,213 @@
+import csv
+import json
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+class _Echo:
+    """
+    Псевдобуфер для csv.writer: возвращает записанную строку.
+    """
+
+    def write(self, value):
+        return value
+
+
+def write_txt(ingredients):
+    """
+    Построчно формирует список покупок в текстовом формате.
+    """
+    yield 'Список покупок:\n'
+    for name, measurement_unit, amount in ingredients:
+        yield f'{name}: {amount} {measurement_unit}\n'
+
+
+def write_csv(ingredients):
+    """
+    Построчно формирует список покупок в формате CSV.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in ingredients:
+        yield writer.writerow(row)
+
+
+def write_json(ingredients):
+    """
+    Построчно формирует список покупок в виде JSON-массива.
+    """
+    separator = '['
+    for name, measurement_unit, amount in ingredients:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': measurement_unit,
+             'amount': amount},
+            ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': write_txt,
+    'csv': write_csv,
+    'json': write_json,
+}
+
+
+def lock_recipe(recipe_id):
+    """
+    Блокирует строку рецепта до конца транзакции. Изменение корзины
+    и изменение ингредиентов рецепта берут эту блокировку до расчёта
+    разницы, поэтому одно из них видит результат другого и список
+    покупок не расходится с корзиной.
+    """
+    Recipe.objects.select_for_update().values_list('id', flat=True).get(
+        pk=recipe_id)
+
+
+def get_recipe_amounts(recipe_id):
+    """
+    Возвращает количество ингредиентов рецепта {id ингредиента: количество}.
+    """
+    return dict(
+        RecipeIngredient.objects
+        .filter(recipe_id=recipe_id)
+        .values('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+        .values_list('ingredient_id', 'total'))
+
+
+@transaction.atomic
+def apply_deltas(deltas_by_user):
+    """
+    Применяет изменения количества {id пользователя: {id ингредиента:
+    разница}} к спискам покупок фиксированным числом запросов.
+
+    Недостающие позиции сначала создаются с нулевым количеством
+    (INSERT ... ON CONFLICT DO NOTHING), а затем все затронутые позиции
+    блокируются и пересчитываются. Поэтому параллельное добавление
+    одного и того же ингредиента не падает на уникальности, а ждёт
+    блокировки строки и суммирует количество.
+    """
+    deltas_by_user = {user_id: deltas
+                      for user_id, deltas in deltas_by_user.items()
+                      if deltas}
+    if not deltas_by_user:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          amount=0)
+         for user_id, deltas in deltas_by_user.items()
+         for ingredient_id, delta in deltas.items() if delta > 0),
+        ignore_conflicts=True)
+    ingredient_ids = {ingredient_id
+                      for deltas in deltas_by_user.values()
+                      for ingredient_id in deltas}
+    items = ShoppingListItem.objects.select_for_update().filter(
+        user_id__in=deltas_by_user, ingredient_id__in=ingredient_ids)
+
+    to_update = []
+    to_delete = []
+    for item in items:
+        delta = deltas_by_user[item.user_id].get(item.ingredient_id)
+        if delta is None:
+            continue
+        if item.amount + delta > 0:
+            item.amount += delta
+            to_update.append(item)
+        else:
+            to_delete.append(item.id)
+
+    if to_delete:
+        ShoppingListItem.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        ShoppingListItem.objects.bulk_update(to_update, ['amount'])
+
+
+@transaction.atomic
+def add_recipe(user_id, recipe_id):
+    """
+    Добавляет ингредиенты рецепта в список покупок пользователя.
+    """
+    lock_recipe(recipe_id)
+    apply_deltas({user_id: get_recipe_amounts(recipe_id)})
+
+
+@transaction.atomic
+def remove_recipe(user_id, recipe_id):
+    """
+    Вычитает ингредиенты рецепта из списка покупок пользователя.
+    """
+    lock_recipe(recipe_id)
+    apply_deltas({user_id: {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+    }})
+
+
+@transaction.atomic
+def recipe_ingredients_changed(recipe_id, deltas):
+    """
+    Применяет изменения ингредиентов рецепта к спискам покупок всех
+    пользователей, у которых рецепт находится в корзине. Вызывающий
+    код берёт lock_recipe до того, как прочитать прежние количества.
+    """
+    if not deltas:
+        return
+    lock_recipe(recipe_id)
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True)
+    apply_deltas({user_id: deltas for user_id in user_ids})
+
+
+def calculate_shopping_lists(user_ids):
+    """
+    Вычисляет списки покупок пользователей с нуля по корзинам:
+    {id пользователя: {id ингредиента: количество}}.
+    """
+    lists = defaultdict(dict)
+    rows = (
+        RecipeIngredient.objects
+        .filter(recipe__in_shopping_cart__user_id__in=user_ids)
+        .values('recipe__in_shopping_cart__user_id', 'ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+        .values_list('recipe__in_shopping_cart__user_id', 'ingredient_id',
+                     'total')
+    )
+    for user_id, ingredient_id, total in rows:
+        lists[user_id][ingredient_id] = total
+    return lists
+
+
+def get_stored_shopping_lists(user_ids):
+    """
+    Возвращает сохранённые списки покупок пользователей
+    {id пользователя: {id ингредиента: количество}}.
+    """
+    lists = defaultdict(dict)
+    rows = ShoppingListItem.objects.filter(
+        user_id__in=user_ids).values_list('user_id', 'ingredient_id',
+                                          'amount')
+    for user_id, ingredient_id, amount in rows:
+        lists[user_id][ingredient_id] = amount
+    return lists
+
+
+@transaction.atomic
+def rebuild_shopping_lists(user_ids):
+    """
+    Пересобирает списки покупок пользователей с нуля.
+    """
+    lists = calculate_shopping_lists(user_ids)
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=amount)
+        for user_id, amounts in lists.items()
+        for ingredient_id, amount in amounts.items()
+    )
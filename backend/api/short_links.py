@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .constants import (RECIPE_CODE_LENGTH, SHORT_LINK_CACHE_TIMEOUT,
+                        SHORT_LINK_LOCAL_TIMEOUT, SHORT_LINK_LRU_SIZE,
+                        SHORT_LINK_NEGATIVE_TIMEOUT)
+from .metrics import metrics
+from .models import Recipe
+
+# Значение в кэше для несуществующего кода.
+MISSING = ''
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш процесса с ограниченным числом записей
+    и сроком жизни каждой записи.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Возвращает (True, значение) или (False, None), если записи
+        нет или она устарела.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = LRUCache(SHORT_LINK_LRU_SIZE)
+
+
+def short_link_cache_key(short_code):
+    """
+    Возвращает ключ общего кэша для короткого кода.
+    """
+    return f'short_link:{short_code}'
+
+
+def get_recipe_path(short_code):
+    """
+    Возвращает путь рецепта по короткому коду или None. Результат,
+    в том числе отсутствие рецепта, кэшируется в памяти процесса
+    и в общем кэше; несуществующие коды — на короткое время.
+    """
+    if len(short_code) > RECIPE_CODE_LENGTH:
+        return None
+    found, path = _local.get(short_code)
+    if not found:
+        path = cache.get(short_link_cache_key(short_code))
+        found = path is not None
+        if not found:
+            recipe = Recipe.objects.filter(
+                short_code=short_code).order_by().only('pk').first()
+            path = MISSING if recipe is None else recipe.get_absolute_url()
+            cache.set(short_link_cache_key(short_code), path,
+                      SHORT_LINK_NEGATIVE_TIMEOUT if path == MISSING
+                      else SHORT_LINK_CACHE_TIMEOUT)
+        _local.set(short_code, path,
+                   SHORT_LINK_NEGATIVE_TIMEOUT if path == MISSING
+                   else SHORT_LINK_LOCAL_TIMEOUT)
+    metrics.record_cache('short_link', int(found), int(not found))
+    return path or None
+
+
+def invalidate_short_link(short_code):
+    """
+    Удаляет короткий код из кэшей. Другие процессы могут отдавать
+    прежний результат из своей памяти не дольше
+    SHORT_LINK_LOCAL_TIMEOUT секунд.
+    """
+    _local.delete(short_code)
+    cache.delete(short_link_cache_key(short_code))
+
+
+def invalidate_short_link_on_commit(short_code):
+    """
+    Удаляет короткий код из кэшей после фиксации транзакции.
+    """
+    if short_code:
+        transaction.on_commit(lambda: invalidate_short_link(short_code))
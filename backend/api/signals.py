@@ -0,0 +1,203 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import shopping_list
+from .cache import (bump_data_version, invalidate_authors,
+                    invalidate_recipes_on_commit)
+from .constants import INGREDIENTS_VERSION, TAGS_VERSION
+from .images import (IMAGE_FIELDS, clear_variants, get_variant_names,
+                     release_files_on_commit, schedule_variants,
+                     set_variant_files)
+from .models import Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+from .search import SEARCH_FIELDS, update_search_vectors_on_commit
+from .short_links import invalidate_short_link_on_commit
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш рецепта при его сохранении или удалении.
+    """
+    invalidate_recipes_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def short_link_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш короткой ссылки рецепта: после удаления код
+    больше не действует, а для нового рецепта мог быть закэширован
+    как несуществующий.
+    """
+    invalidate_short_link_on_commit(instance.short_code)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields, **kwargs):
+    """
+    Пересчитывает поисковый вектор, если изменились название
+    или описание рецепта.
+    """
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        update_search_vectors_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, update_fields, **kwargs):
+    """
+    Ставит в очередь создание уменьшенных копий новой картинки
+    рецепта или аватара.
+    """
+    if update_fields is None or {'image', 'avatar'} & set(update_fields):
+        schedule_variants(instance)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def image_replacing(sender, instance, update_fields, **kwargs):
+    """
+    Запоминает прежнюю картинку рецепта или аватар и их варианты,
+    если картинку заменяют или удаляют.
+    """
+    field_name, variants_field = IMAGE_FIELDS[instance._meta.label]
+    instance._replaced_files = []
+    instance._replaced_variants = False
+    if instance._state.adding or (
+            update_fields is not None and field_name not in update_fields):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values_list(
+        field_name, variants_field).first()
+    if previous is None:
+        return
+    name, variants = previous
+    if name and name != getattr(instance, field_name).name:
+        instance._replaced_files = [name, *get_variant_names(variants)]
+        instance._replaced_variants = bool(variants)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_replaced(sender, instance, **kwargs):
+    """
+    Очищает варианты прежней картинки и удаляет её файлы, если на них
+    больше нет ссылок.
+    """
+    if getattr(instance, '_replaced_variants', False):
+        # Варианты относятся к прежней картинке; новые создаст
+        # schedule_variants.
+        clear_variants(instance)
+        instance._replaced_variants = False
+    release_files_on_commit(
+        instance._meta.label, getattr(instance, '_replaced_files', ()))
+    instance._replaced_files = []
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_deleted(sender, instance, **kwargs):
+    """
+    Удаляет картинку удалённого рецепта или аватар удалённого
+    пользователя, если на файлы больше нет ссылок.
+    """
+    field_name, variants_field = IMAGE_FIELDS[instance._meta.label]
+    set_variant_files(instance._meta.label, instance.pk, {})
+    release_files_on_commit(instance._meta.label, [
+        getattr(instance, field_name).name,
+        *get_variant_names(getattr(instance, variants_field))])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """
+    Вычитает ингредиенты удаляемого рецепта из списков покупок
+    пользователей, у которых он находится в корзине.
+    """
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe_id=instance.pk).values_list('user_id', flat=True))
+    if user_ids:
+        amounts = shopping_list.get_recipe_amounts(instance.pk)
+        shopping_list.apply_deltas({
+            user_id: {ingredient_id: -amount
+                      for ingredient_id, amount in amounts.items()}
+            for user_id in user_ids
+        })
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш и поисковый вектор рецепта при изменении
+    его ингредиентов.
+    """
+    invalidate_recipes_on_commit([instance.recipe_id])
+    update_search_vectors_on_commit([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Сбрасывает кэш рецептов при изменении набора тегов.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_recipes_on_commit([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_recipes_on_commit(
+            instance.recipe_set.values_list('id', flat=True))
+    else:
+        invalidate_recipes_on_commit(pk_set)
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш рецептов с изменённым тегом.
+    """
+    invalidate_recipes_on_commit(
+        Recipe.tags.through.objects.filter(
+            tag_id=instance.pk).values_list('recipe_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tags_version_changed(sender, **kwargs):
+    """
+    Увеличивает версию справочника тегов в транзакции изменения.
+    """
+    bump_data_version(TAGS_VERSION)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredients_version_changed(sender, **kwargs):
+    """
+    Увеличивает версию справочника ингредиентов в транзакции изменения.
+    """
+    bump_data_version(INGREDIENTS_VERSION)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    """
+    Сбрасывает кэш и поисковые векторы рецептов с изменённым
+    ингредиентом.
+    """
+    if not created:
+        recipe_ids = list(
+            instance.ingredient_recipes.values_list('recipe_id', flat=True))
+        invalidate_recipes_on_commit(recipe_ids)
+        update_search_vectors_on_commit(recipe_ids)
+
+
+@receiver([post_save, post_delete], sender=User)
+def author_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш автора при изменении профиля или аватара.
+    """
+    author_id = instance.pk
+    transaction.on_commit(lambda: invalidate_authors([author_id]))
@@ -0,0 +1,188 @@
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+RESET_MARKER_SUFFIX = '.reset'
+ARCHIVE_SUFFIX = '.archive.json'
+LOCK_SUFFIX = '.lock'
+# Снимки процессов другого хоста (контейнера), для которых нельзя
+# проверить, жив ли процесс, удаляются, если не обновлялись дольше.
+FOREIGN_SNAPSHOT_TTL = 24 * 60 * 60
+
+
+def is_process_alive(pid):
+    """
+    Проверяет, существует ли процесс pid на текущем хосте.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ProcessSnapshotStore:
+    """
+    Общее файловое хранилище снимков данных процессов: каждый процесс
+    сервера (воркер gunicorn, runserver) атомарно пишет свой снимок
+    в файл <name>-<host>-<pid>.json, а отчёты читают и объединяют
+    снимки всех процессов.
+
+    Процесс считается серверным после вызова mark_server_process()
+    из foodgram.wsgi или foodgram.asgi; остальные процессы (команды
+    manage.py, тесты) снимки не пишут. Снимки завершившихся процессов
+    удаляются при чтении; если задана функция merge(архив, данные),
+    данные снимка сначала добавляются в архив <name>.archive.json,
+    чтобы накопительные значения не уменьшались при перезапуске
+    воркеров.
+    """
+
+    server_process = False
+
+    def __init__(self, directory, name, merge=None):
+        self.directory = Path(directory)
+        self.name = name
+        self.merge = merge
+        self.lock = threading.Lock()
+
+    @property
+    def reset_marker(self):
+        return self.directory / f'{self.name}{RESET_MARKER_SUFFIX}'
+
+    @property
+    def archive_path(self):
+        return self.directory / f'{self.name}{ARCHIVE_SUFFIX}'
+
+    @contextmanager
+    def file_lock(self):
+        """
+        Блокировка хранилища между процессами на время изменения архива.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / f'{self.name}{LOCK_SUFFIX}', 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def reset_time(self):
+        """
+        Возвращает время последнего сброса или 0.
+        """
+        try:
+            return self.reset_marker.stat().st_mtime
+        except FileNotFoundError:
+            return 0
+
+    def write(self, data):
+        """
+        Атомарно сохраняет снимок текущего процесса сервера. Если
+        снимок уже пишет другой поток, запись пропускается.
+        """
+        if not self.server_process or not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            host, pid = socket.gethostname(), os.getpid()
+            path = self.directory / f'{self.name}-{host}-{pid}.json'
+            temporary = path.with_suffix('.tmp')
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump({'host': host, 'pid': pid, 'server': True,
+                           'updated_at': time.time(), 'data': data}, file)
+            os.replace(temporary, path)
+        finally:
+            self.lock.release()
+
+    def read_all(self):
+        """
+        Возвращает снимки живых процессов сервера: список словарей
+        с ключами host, pid, updated_at и data. Повреждённые файлы
+        и снимки не серверных процессов пропускаются, снимки
+        завершившихся процессов переносятся в архив (см. drop).
+        """
+        host = socket.gethostname()
+        stale_before = time.time() - FOREIGN_SNAPSHOT_TTL
+        snapshots = []
+        for path in self.directory.glob(f'{self.name}-*.json'):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            if not snapshot.get('server'):
+                continue
+            if snapshot['host'] == host:
+                alive = (snapshot['pid'] == os.getpid()
+                         or is_process_alive(snapshot['pid']))
+            else:
+                alive = snapshot['updated_at'] >= stale_before
+            if not alive:
+                self.drop(path)
+                continue
+            snapshots.append(snapshot)
+        return snapshots
+
+    def drop(self, path):
+        """
+        Удаляет снимок завершившегося процесса, предварительно добавив
+        его данные в архив. Снимок перечитывается под блокировкой,
+        поэтому параллельные читатели не учтут его в архиве дважды.
+        """
+        if self.merge is None:
+            path.unlink(missing_ok=True)
+            return
+        with self.file_lock():
+            try:
+                with open(path, encoding='utf-8') as file:
+                    data = json.load(file)['data']
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError, KeyError):
+                path.unlink(missing_ok=True)
+                return
+            archive = self.read_archive()
+            if archive is not None:
+                data = self.merge(archive, data)
+            temporary = self.archive_path.with_suffix('.tmp')
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump(data, file)
+            os.replace(temporary, self.archive_path)
+            path.unlink(missing_ok=True)
+
+    def read_archive(self):
+        """
+        Возвращает накопленные данные завершившихся процессов или None.
+        """
+        try:
+            with open(self.archive_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def reset(self):
+        """
+        Удаляет снимки всех процессов и архив и отмечает время сброса,
+        чтобы процессы очистили накопленные в памяти данные.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self.file_lock():
+            for path in self.directory.glob(f'{self.name}-*.json'):
+                path.unlink(missing_ok=True)
+            self.archive_path.unlink(missing_ok=True)
+        self.reset_marker.touch()
+
+
+def mark_server_process():
+    """
+    Разрешает текущему процессу сохранять снимки. Вызывается модулями
+    WSGI и ASGI, которые загружают только процессы сервера.
+    """
+    ProcessSnapshotStore.server_process = True
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+BLOB_DIRECTORY = 'blobs'
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class BlobExists(Exception):
+    """
+    Файл с таким содержимым уже сохранён.
+    """
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором файл называется по SHA-256 содержимого:
+    blobs/<первые 2 символа хэша>/<хэш>.<расширение>. Одинаковые
+    файлы хранятся один раз, а содержимое файла по URL никогда
+    не меняется, поэтому его можно кэшировать навсегда.
+
+    Файл может использоваться несколькими объектами, поэтому удалять
+    его можно только после проверки ссылок (api.images.release_files).
+    Время изменения файла обновляется при каждой повторной загрузке.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        blob_name = self.get_blob_name(name, content)
+        if self.exists(blob_name):
+            # Время изменения отмечает последнее использование файла,
+            # чтобы его не удалили как неиспользуемый сразу после
+            # повторной загрузки.
+            os.utime(self.path(blob_name))
+            return blob_name
+        try:
+            return super().save(blob_name, content, max_length)
+        except BlobExists:
+            # Параллельная загрузка того же содержимого успела сохранить
+            # файл после проверки exists.
+            return blob_name
+
+    def get_available_name(self, name, max_length=None):
+        """
+        Имя файла определяется содержимым, поэтому другое имя для
+        существующего файла не подбирается: save получает BlobExists
+        и возвращает имя уже сохранённого файла.
+        """
+        if self.exists(name):
+            raise BlobExists(name)
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                f'Имя файла "{name}" длиннее {max_length} символов.')
+        return name
+
+    @staticmethod
+    def get_blob_name(name, content):
+        """
+        Возвращает имя файла по хэшу содержимого, сохраняя расширение
+        исходного имени.
+        """
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        extension = posixpath.splitext(name)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(
+            BLOB_DIRECTORY, hexdigest[:2], f'{hexdigest}{extension}')
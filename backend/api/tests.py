@@ -0,0 +1,1213 @@
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from operator import itemgetter
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Value
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from . import cache as data_cache
+from . import ingredient_index, shopping_list, short_links
+from .cache import (bump_data_version, get_generations, invalidate_recipes,
+                    set_recipe_fragments)
+from .constants import (DATA_VERSION_CHECK_INTERVAL, INGREDIENTS_VERSION,
+                        REFERENCE_SNAPSHOT_TTL, SHORT_LINK_NEGATIVE_TIMEOUT,
+                        TAGS_VERSION)
+from .filters import filter_by_similarity, search_recipes
+from .images import get_referenced_files, get_variant_names, get_variant_urls
+from .management.commands.benchmark_endpoints import \
+    Command as BenchmarkCommand
+from .management.commands.load_data import iter_json_array
+from .metrics import Metrics
+from .mixins import ReferenceDataMixin
+from .models import (Favorite, ImageVariantFile, Ingredient, Recipe,
+                     RecipeIngredient, ShoppingCart, ShoppingListItem, Tag)
+from .paginators import CustomPageNumberPagination
+from .query_stats import QueryStats, fingerprint
+from .relations import get_user_relations
+from .representations import (RECIPE_ROW_FIELDS, build_recipe_fragments,
+                              render_recipes)
+from .search import update_search_vectors_in_batches
+from .serializers import (CustomUserSerializer, IngredientWithAmountSerializer,
+                          RecipeOutputSerializer, TagSerializer)
+from .snapshots import FOREIGN_SNAPSHOT_TTL, ProcessSnapshotStore
+from .storage import ContentAddressedStorage
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_data(color='red', size=(20, 20), image_format='PNG'):
+    """
+    Возвращает картинку в формате data:image/<формат>;base64.
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, image_format)
+    return (f'data:image/{image_format.lower()};base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FoodgramTestCase(APITestCase):
+    """
+    Общие данные тестов: пользователи, теги, ингредиенты и рецепты.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{number}', email=f'user{number}@example.com',
+                password='password-12345', first_name='Имя',
+                last_name='Фамилия')
+            for number in range(3)
+        ]
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       slug=f'tag{number}')
+                    for number in range(2)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in [('соль', 'г'), ('сахар', 'г'),
+                               ('молоко', 'мл'), ('масло сливочное', 'г')]
+        ]
+
+    def setUp(self):
+        # Кэш и снимки справочников живут в памяти процесса, а данные
+        # и версии в БД откатываются после каждого теста.
+        cache.clear()
+        ReferenceDataMixin._snapshots.clear()
+        data_cache._checked_versions.clear()
+        short_links._local.clear()
+        ingredient_index._index = None
+        self.anonymous = APIClient()
+        self.clients = []
+        for user in self.users:
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients.append(client)
+
+    def recipe_payload(self, ingredient_count=1, **kwargs):
+        payload = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image_data(),
+            'tags': [self.tags[0].id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10 + number}
+                for number, ingredient
+                in enumerate(self.ingredients[:ingredient_count])
+            ],
+        }
+        payload.update(kwargs)
+        return payload
+
+    def create_recipe(self, client, **kwargs):
+        response = client.post('/api/recipes/',
+                               self.recipe_payload(**kwargs), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.json()['id'])
+
+
+class SubscriptionsTests(FoodgramTestCase):
+
+    def test_empty_page_with_recipes_limit(self):
+        response = self.clients[0].get(
+            '/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_recipes_limit(self):
+        for number in range(3):
+            self.create_recipe(self.clients[1], name=f'Рецепт {number}')
+        self.create_recipe(self.clients[2])
+        self.users[0].subscribed_to.add(self.users[1], self.users[2])
+
+        response = self.clients[0].get(
+            '/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(response.status_code, 200)
+        authors = {author['id']: author
+                   for author in response.json()['results']}
+        recipes = authors[self.users[1].id]['recipes']
+        self.assertEqual([recipe['name'] for recipe in recipes],
+                         ['Рецепт 2', 'Рецепт 1'])
+        self.assertEqual(authors[self.users[1].id]['recipes_count'], 3)
+        self.assertEqual(len(authors[self.users[2].id]['recipes']), 1)
+
+        response = self.clients[0].get(
+            '/api/users/subscriptions/?recipes_limit=0')
+        self.assertEqual(
+            [author['recipes'] for author in response.json()['results']],
+            [[], []])
+
+
+class ReferenceDataTests(FoodgramTestCase):
+
+    def test_version_change_from_another_process(self):
+        response = self.anonymous.get('/api/tags/')
+        etag = response['ETag']
+        self.assertEqual(
+            self.anonymous.get('/api/tags/',
+                               HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Изменение в обход сигналов, как в load_data или другом
+        # процессе: версия увеличивается в БД в той же транзакции.
+        with transaction.atomic():
+            Tag.objects.filter(pk=self.tags[0].pk).update(name='Новый тег')
+            bump_data_version(TAGS_VERSION)
+
+        # Версию из БД процесс перечитывает не чаще раза
+        # в DATA_VERSION_CHECK_INTERVAL секунд.
+        self.assertEqual(
+            self.anonymous.get('/api/tags/',
+                               HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('api.cache.time.monotonic',
+                        return_value=time.monotonic()
+                        + DATA_VERSION_CHECK_INTERVAL + 1):
+            response = self.anonymous.get('/api/tags/',
+                                          HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Новый тег', [tag['name'] for tag in response.json()])
+
+    def test_local_change_is_visible_after_commit(self):
+        etag = self.anonymous.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Новый тег', slug='new')
+        response = self.anonymous.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_revalidation_is_query_free(self):
+        etag = self.anonymous.get('/api/tags/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.anonymous.get('/api/tags/',
+                                          HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_snapshot_ttl(self):
+        self.anonymous.get('/api/tags/')
+        Tag.objects.filter(pk=self.tags[0].pk).update(name='Новый тег')
+        self.assertNotIn(
+            'Новый тег',
+            [tag['name'] for tag in self.anonymous.get('/api/tags/').json()])
+        with mock.patch('api.mixins.time.monotonic',
+                        return_value=time.monotonic()
+                        + REFERENCE_SNAPSHOT_TTL + 1):
+            response = self.anonymous.get('/api/tags/')
+        self.assertIn('Новый тег', [tag['name'] for tag in response.json()])
+
+
+class RecipeCacheTests(FoodgramTestCase):
+
+    def test_fragment_built_before_invalidation_is_not_served(self):
+        recipe = self.create_recipe(self.clients[0], name='Старое')
+        # Запрос прочитал поколение и строки до изменения рецепта,
+        # а сохранил фрагмент уже после сброса кэша.
+        generations = get_generations('recipe', [recipe.pk])
+        stale = build_recipe_fragments([recipe.pk])
+        Recipe.objects.filter(pk=recipe.pk).update(name='Новое')
+        invalidate_recipes([recipe.pk])
+        set_recipe_fragments(generations, stale)
+
+        response = self.anonymous.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.json()['name'], 'Новое')
+
+    def test_update_invalidates_cached_recipe(self):
+        recipe = self.create_recipe(self.clients[0], name='Старое')
+        self.anonymous.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.clients[0].patch(
+                f'/api/recipes/{recipe.pk}/',
+                self.recipe_payload(name='Новое'), format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.anonymous.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['name'], 'Новое')
+
+
+class RecipeReferenceSerializer(serializers.ModelSerializer):
+    """
+    Прежний сериализатор рецепта на полях DRF: эталон формата,
+    который render_recipes собирает из фрагментов.
+    """
+
+    ingredients = IngredientWithAmountSerializer(
+        source='recipe_ingredients', many=True)
+    tags = TagSerializer(many=True)
+    author = CustomUserSerializer()
+    image_variants = serializers.SerializerMethodField()
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'tags', 'author', 'ingredients',
+            'name', 'image', 'image_variants', 'text', 'cooking_time',
+            'is_favorited', 'is_in_shopping_cart'
+        )
+
+    def get_image_variants(self, obj):
+        return get_variant_urls(obj.image.storage, obj.image_variants,
+                                self.context.get('request'))
+
+    def get_is_favorited(self, obj):
+        return obj.id in get_user_relations(
+            self.context['request']).favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        return obj.id in get_user_relations(
+            self.context['request']).shopping_cart
+
+
+class RecipeRepresentationTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        author = cls.users[1]
+        author.avatar = 'users/avatar.png'
+        author.avatar_variants = {
+            'thumbnail': {'default': 'users/avatar-thumbnail.png',
+                          'webp': 'users/avatar-thumbnail.webp'}}
+        author.save()
+        cls.recipes = []
+        for number, user in enumerate([cls.users[1], cls.users[1],
+                                       cls.users[2]]):
+            recipe = Recipe.objects.create(
+                author=user, name=f'Рецепт {number}', text='Описание',
+                cooking_time=5 + number, image=f'recipes/images/{number}.png',
+                image_variants={
+                    'thumbnail': {'default': f'recipes/images/{number}-t.png'}
+                })
+            recipe.tags.set(cls.tags[:number + 1])
+            for ingredient in reversed(cls.ingredients[:number + 2]):
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1)
+            cls.recipes.append(recipe)
+        viewer = cls.users[0]
+        viewer.subscribed_to.add(cls.users[1])
+        Favorite.objects.create(user=viewer, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=viewer, recipe=cls.recipes[1])
+
+    def assert_same_as_reference(self, client, user=None):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        if user is not None:
+            request.user = user
+        expected = JSONRenderer().render(RecipeReferenceSerializer(
+            Recipe.objects.all(), many=True,
+            context={'request': request}).data)
+
+        rows = Recipe.objects.values(*RECIPE_ROW_FIELDS)
+        self.assertEqual(
+            JSONRenderer().render(render_recipes(list(rows), request)),
+            expected)
+        # Повторно — из кэша фрагментов.
+        response = client.get('/api/recipes/')
+        self.assertEqual(
+            JSONRenderer().render(response.data['results']), expected)
+        for recipe in self.recipes:
+            response = client.get(f'/api/recipes/{recipe.pk}/')
+            self.assertEqual(
+                JSONRenderer().render(response.data),
+                JSONRenderer().render(RecipeReferenceSerializer(
+                    recipe, context={'request': request}).data))
+
+    def test_anonymous(self):
+        self.assert_same_as_reference(self.anonymous)
+
+    def test_authenticated(self):
+        self.assert_same_as_reference(self.clients[0], self.users[0])
+        response = self.clients[0].get('/api/recipes/')
+        flags = {recipe['id']: (recipe['is_favorited'],
+                                recipe['is_in_shopping_cart'],
+                                recipe['author']['is_subscribed'])
+                 for recipe in response.json()['results']}
+        self.assertEqual(flags, {
+            self.recipes[0].pk: (True, False, True),
+            self.recipes[1].pk: (False, True, True),
+            self.recipes[2].pk: (False, False, False),
+        })
+
+    def test_output_serializer(self):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = self.users[0]
+        context = {'request': request}
+        self.assertEqual(
+            RecipeOutputSerializer(self.recipes, many=True,
+                                   context=context).data,
+            RecipeReferenceSerializer(self.recipes, many=True,
+                                      context=context).data)
+
+    def test_benchmark_against_drf_serializer(self):
+        for number in range(200):
+            recipe = Recipe.objects.create(
+                author=self.users[number % 3], name=f'Блюдо {number}',
+                text='Описание', cooking_time=10,
+                image=f'recipes/images/{number}.png')
+            recipe.tags.set(self.tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in self.ingredients)
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = self.users[0]
+        context = {'request': request}
+
+        def serializer_page():
+            queryset = Recipe.objects.select_related(
+                'author').prefetch_related(
+                    'tags', 'recipe_ingredients__ingredient')
+            return JSONRenderer().render(RecipeReferenceSerializer(
+                queryset, many=True, context=context).data)
+
+        def fragments_page():
+            rows = list(Recipe.objects.values(*RECIPE_ROW_FIELDS))
+            return JSONRenderer().render(render_recipes(rows, request))
+
+        # Первый вызов заполняет кэш фрагментов, как на прогретом сервере.
+        self.assertEqual(fragments_page(), serializer_page())
+
+        started = time.perf_counter()
+        for _ in range(5):
+            serializer_page()
+        serializer_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(5):
+            fragments_page()
+        fragments_time = time.perf_counter() - started
+        self.assertLess(fragments_time, serializer_time)
+
+
+class QueryCountTests(FoodgramTestCase):
+    """
+    Число запросов к БД на основных маршрутах рецептов при прогретом
+    кэше фрагментов. Клиенты авторизуются токеном, как в продакшене:
+    один запрос уходит на проверку токена.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.token_clients = []
+        for user in self.users:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token '
+                               + Token.objects.create(user=user).key)
+            self.token_clients.append(client)
+        for number in range(3):
+            self.create_recipe(self.clients[1 + number % 2])
+        self.anonymous.get('/api/recipes/')
+
+    def test_list(self):
+        with self.assertNumQueries(2):
+            response = self.anonymous.get('/api/recipes/')
+        self.assertEqual(len(response.json()['results']), 3)
+        # Токен, число рецептов, страница и связи пользователя:
+        # подписки, избранное, корзина.
+        with self.assertNumQueries(6):
+            self.token_clients[0].get('/api/recipes/')
+
+    def test_detail(self):
+        recipe = Recipe.objects.first()
+        with self.assertNumQueries(5):
+            response = self.token_clients[0].get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_does_not_depend_on_ingredient_count(self):
+        for ingredient_count in range(1, len(self.ingredients) + 1):
+            with self.subTest(ingredient_count=ingredient_count):
+                with self.assertNumQueries(18):
+                    response = self.token_clients[1].post(
+                        '/api/recipes/',
+                        self.recipe_payload(ingredient_count),
+                        format='json')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.json()['ingredients']),
+                                 ingredient_count)
+
+
+class IngredientIndexTests(FoodgramTestCase):
+
+    def test_prefix_matches_first(self):
+        Ingredient.objects.create(name='сливки', measurement_unit='мл')
+        response = self.anonymous.get('/api/ingredients/', {'name': 'Сл'})
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.json()],
+            ['сливки', 'масло сливочное'])
+
+    def test_autocomplete_is_query_free(self):
+        self.anonymous.get('/api/ingredients/', {'name': 'с'})
+        for query in ('со', 'сол', 'соль'):
+            with self.assertNumQueries(0):
+                response = self.anonymous.get('/api/ingredients/',
+                                              {'name': query})
+            self.assertEqual(response.status_code, 200)
+
+    def test_benchmark_against_orm(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'продукт {number:05d}', measurement_unit='г')
+            for number in range(5000))
+        bump_data_version(INGREDIENTS_VERSION)
+        queries = ['продукт 0', 'продукт 012', '123', '99', 'соль', 'ол']
+        index = ingredient_index.get_ingredient_index()
+
+        started = time.perf_counter()
+        for _ in range(10):
+            found = [index.search(query) for query in queries]
+        index_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(10):
+            expected = [list(Ingredient.objects
+                             .filter(name__icontains=query)
+                             .values('id', 'name', 'measurement_unit'))
+                        for query in queries]
+        orm_time = time.perf_counter() - started
+
+        for query, items, rows in zip(queries, found, expected):
+            with self.subTest(query=query):
+                self.assertTrue(items)
+                self.assertEqual(sorted(items, key=itemgetter('id')),
+                                 sorted(rows, key=itemgetter('id')))
+        self.assertLess(index_time, orm_time)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Индексы pg_trgm и полнотекстового поиска есть только в '
+            'PostgreSQL')
+class SearchIndexTests(FoodgramTestCase):
+    """
+    Поисковые запросы обслуживаются GIN-индексами из миграций
+    0009, 0010 и 0015. На маленькой тестовой таблице планировщик
+    выбрал бы полный просмотр, поэтому он отключается.
+    """
+
+    def explain(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_ingredient_search_uses_trigram_indexes(self):
+        plan = self.explain(filter_by_similarity(
+            Ingredient.objects.all(), 'name', 'мол'))
+        self.assertIn('api_ingredient_name_trgm', plan)
+        self.assertIn('api_ingredient_name_upper_trgm', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_recipe_search_uses_search_vector_and_trigram_indexes(self):
+        plan = self.explain(search_recipes(Recipe.objects.all(), 'молоко'))
+        self.assertIn('api_recipe_search_vector_gin', plan)
+        self.assertIn('api_recipe_name_trgm', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+
+class ProcessSnapshotStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.store = ProcessSnapshotStore(directory, 'metrics')
+
+    def write_snapshot(self, host, pid, updated_at=None, server=True):
+        path = self.store.directory / f'metrics-{host}-{pid}.json'
+        path.write_text(json.dumps({
+            'host': host, 'pid': pid, 'server': server,
+            'updated_at': time.time() if updated_at is None else updated_at,
+            'data': {}}))
+        return path
+
+    def test_only_server_process_writes(self):
+        self.store.write({})
+        self.assertEqual(self.store.read_all(), [])
+        with mock.patch.object(ProcessSnapshotStore, 'server_process', True):
+            self.store.write({'counter': 1})
+        self.assertEqual([snapshot['data']
+                          for snapshot in self.store.read_all()],
+                         [{'counter': 1}])
+
+    def test_read_all_skips_and_prunes(self):
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        host = socket.gethostname()
+        live = self.write_snapshot(host, os.getpid())
+        dead = self.write_snapshot(host, finished.pid)
+        foreign = self.write_snapshot('other-host', 1)
+        stale = self.write_snapshot(
+            'old-host', 1, time.time() - FOREIGN_SNAPSHOT_TTL - 1)
+        command = self.write_snapshot(host, os.getppid(), server=False)
+
+        self.assertEqual(
+            sorted((snapshot['host'], snapshot['pid'])
+                   for snapshot in self.store.read_all()),
+            sorted([(host, os.getpid()), ('other-host', 1)]))
+        self.assertTrue(live.exists())
+        self.assertTrue(foreign.exists())
+        self.assertTrue(command.exists())
+        self.assertFalse(dead.exists())
+        self.assertFalse(stale.exists())
+
+    def test_finished_workers_are_archived(self):
+        metrics = Metrics(self.store.directory, flush_interval=60)
+        labels = [['method', 'GET'], ['view', 'recipes']]
+        host = socket.gethostname()
+        for requests in (5, 3):
+            finished = subprocess.Popen(['true'])
+            finished.wait()
+            path = (metrics.store.directory
+                    / f'metrics-{host}-{finished.pid}.json')
+            path.write_text(json.dumps({
+                'host': host, 'pid': finished.pid, 'server': True,
+                'updated_at': time.time(), 'data': {
+                    'started': time.time(),
+                    'counters': [
+                        ['foodgram_http_requests_total', labels, requests]],
+                    'histograms': [
+                        ['foodgram_db_queries_per_request', labels,
+                         [0, requests, 0, 0, 0, 0, 0, 0], requests,
+                         requests]],
+                }}))
+            counters, histograms, workers = metrics.collect()
+            self.assertFalse(path.exists())
+        key = tuple(map(tuple, labels))
+        self.assertEqual(
+            counters[('foodgram_http_requests_total', key)], 8)
+        self.assertEqual(
+            histograms[('foodgram_db_queries_per_request', key)],
+            [[0, 8, 0, 0, 0, 0, 0, 0], 8, 8])
+        self.assertEqual(metrics.collect()[:2], (counters, histograms))
+        self.assertEqual(workers, [])
+
+
+class QueryStatsTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.stats = QueryStats(directory, flush_interval=60)
+
+    def test_fingerprint(self):
+        cases = {
+            "SELECT * FROM t WHERE id = 5 AND name = 'O''Brien'":
+                'SELECT * FROM t WHERE id = ? AND name = ?',
+            'SELECT "t"."col1" FROM "t" WHERE "t"."id" IN (%s, %s, %s)':
+                'SELECT "t"."col1" FROM "t" WHERE "t"."id" IN (...)',
+            'SELECT * FROM t WHERE x IN (1, 2,\n 3) LIMIT 21':
+                'SELECT * FROM t WHERE x IN (...) LIMIT ?',
+            'INSERT INTO t ("a", "b") VALUES (%s, %s), (%s, %s), (%s, %s)':
+                'INSERT INTO t ("a", "b") VALUES (...)',
+            'SELECT  a\n  FROM t WHERE a > -1.5':
+                'SELECT a FROM t WHERE a > ?',
+        }
+        for sql, expected in cases.items():
+            with self.subTest(sql=sql):
+                self.assertEqual(fingerprint(sql), expected)
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s, %s)'))
+
+    def test_stats_are_merged_across_processes(self):
+        sql = 'SELECT * FROM "api_tag" WHERE "api_tag"."id" = %s'
+        self.stats.record('GET tags', [(sql, 0.002), (sql, 0.004)])
+        self.stats.record('GET tags', [(sql, 0.003)])
+        with mock.patch.object(ProcessSnapshotStore, 'server_process', True):
+            self.stats.flush()
+        other = self.stats.store.directory / 'queries-other-host-1.json'
+        other.write_text(json.dumps({
+            'host': 'other-host', 'pid': 1, 'server': True,
+            'updated_at': time.time(), 'data': [{
+                'view': 'GET tags', 'fingerprint': fingerprint(sql),
+                'count': 2, 'total': 0.01, 'max': 0.008}]}))
+
+        [entry] = self.stats.top()
+        self.assertEqual(entry['view'], 'GET tags')
+        self.assertEqual(entry['fingerprint'], fingerprint(sql))
+        self.assertEqual(entry['count'], 5)
+        self.assertAlmostEqual(entry['total'], 0.019)
+        self.assertEqual(entry['max'], 0.008)
+        self.assertAlmostEqual(entry['mean'], 0.019 / 5)
+
+        self.stats.reset()
+        self.assertEqual(self.stats.top(), [])
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=directory)
+
+    def test_identical_uploads_racing_past_exists(self):
+        name = self.storage.save('a.png', ContentFile(b'content'))
+        # Вторая загрузка не увидела файл при проверке exists: в save
+        # или ещё и в get_available_name, и столкнулась с ним при записи.
+        for checks in ([False, True], [False, False, True]):
+            with self.subTest(checks=checks), mock.patch.object(
+                    FileSystemStorage, 'exists', side_effect=checks):
+                self.assertEqual(
+                    self.storage.save('b.png', ContentFile(b'content')),
+                    name)
+        files = [path for path in Path(self.storage.location).rglob('*')
+                 if path.is_file()]
+        self.assertEqual(files, [Path(self.storage.path(name))])
+        self.assertEqual(files[0].read_bytes(), b'content')
+
+
+class ImageUploadTests(FoodgramTestCase):
+
+    def test_large_png_is_rejected_before_decoding(self):
+        response = self.clients[0].post(
+            '/api/recipes/',
+            self.recipe_payload(image=image_data(size=(2600, 2600))),
+            format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+    def test_large_jpeg_is_downscaled(self):
+        recipe = self.create_recipe(
+            self.clients[0],
+            image=image_data(size=(4000, 3000), image_format='JPEG'))
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(image.size, (2000, 1500))
+
+
+class RecipeUpdateTests(FoodgramTestCase):
+
+    def patch(self, recipe, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.clients[0].patch(
+                f'/api/recipes/{recipe.pk}/', self.recipe_payload(**kwargs),
+                format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))]
+
+    def test_unchanged_recipe_is_not_written(self):
+        recipe = self.create_recipe(self.clients[0])
+        self.assertEqual(self.patch(recipe), [])
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).image.name,
+                         recipe.image.name)
+
+    def test_changed_image_is_saved(self):
+        recipe = self.create_recipe(self.clients[0])
+        writes = self.patch(recipe, image=image_data(color='blue'))
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"image"', writes[0])
+        self.assertNotEqual(Recipe.objects.get(pk=recipe.pk).image.name,
+                            recipe.image.name)
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantFileTests(FoodgramTestCase):
+
+    def create_recipe_with_variants(self, client):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe(client)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants)
+        return recipe
+
+    def test_variant_files_are_indexed(self):
+        recipe = self.create_recipe_with_variants(self.clients[0])
+        names = get_variant_names(recipe.image_variants)
+        self.assertCountEqual(
+            ImageVariantFile.objects.filter(
+                model_label='api.Recipe', object_id=recipe.pk).values_list(
+                    'name', flat=True), names)
+        with CaptureQueriesContext(connection) as queries:
+            referenced = get_referenced_files(
+                [recipe.image.name, *names, 'blobs/00/missing.png'])
+        self.assertEqual(referenced, {recipe.image.name, *names})
+        self.assertFalse(any('LIKE' in query['sql']
+                             for query in queries.captured_queries))
+
+    @mock.patch('api.images.RELEASE_GRACE_PERIOD', -60)
+    def test_shared_variants_are_released_with_last_reference(self):
+        first = self.create_recipe_with_variants(self.clients[0])
+        second = self.create_recipe_with_variants(self.clients[1])
+        names = get_variant_names(first.image_variants)
+        self.assertEqual(names, get_variant_names(second.image_variants))
+        storage = first.image.storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clients[0].patch(
+                f'/api/recipes/{first.pk}/',
+                self.recipe_payload(image=image_data(color='blue')),
+                format='json')
+        self.assertFalse(ImageVariantFile.objects.filter(
+            name__in=names, object_id=first.pk).exists())
+        self.assertTrue(all(storage.exists(name) for name in names))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ImageVariantFile.objects.filter(
+            name__in=names).exists())
+        self.assertFalse(any(storage.exists(name) for name in names))
+
+
+class ShoppingListTests(FoodgramTestCase):
+
+    def amounts(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient_id', 'amount'))
+
+    def test_deltas_are_applied(self):
+        user = self.users[0]
+        salt, sugar = self.ingredients[:2]
+        shopping_list.apply_deltas({user.id: {salt.id: 5, sugar.id: 3}})
+        shopping_list.apply_deltas({user.id: {salt.id: 2, sugar.id: -3}})
+        self.assertEqual(self.amounts(user), {salt.id: 7})
+
+    def test_item_created_concurrently_is_incremented(self):
+        user = self.users[0]
+        salt = self.ingredients[0]
+        # Позицию успела создать параллельная транзакция: вставка
+        # пропускается без IntegrityError, количество суммируется.
+        ShoppingListItem.objects.create(user=user, ingredient=salt, amount=4)
+        with transaction.atomic():
+            shopping_list.apply_deltas({user.id: {salt.id: 6}})
+        self.assertEqual(self.amounts(user), {salt.id: 10})
+
+    def test_cart_and_ingredient_changes_lock_recipe(self):
+        recipe = self.create_recipe(self.clients[0], ingredient_count=2)
+        with mock.patch('api.shopping_list.lock_recipe',
+                        wraps=shopping_list.lock_recipe) as lock_recipe:
+            response = self.clients[1].post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/')
+            self.assertEqual(response.status_code, 201)
+            lock_recipe.assert_called_with(recipe.pk)
+            lock_recipe.reset_mock()
+            response = self.clients[0].patch(
+                f'/api/recipes/{recipe.pk}/',
+                self.recipe_payload(ingredient_count=3), format='json')
+            self.assertEqual(response.status_code, 200)
+            lock_recipe.assert_called_with(recipe.pk)
+        self.assertEqual(
+            self.amounts(self.users[1]),
+            {ingredient.id: 10 + number
+             for number, ingredient in enumerate(self.ingredients[:3])})
+
+    def test_admin_is_read_only(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com',
+            password='password-12345')
+        item = ShoppingListItem.objects.create(
+            user=self.users[0], ingredient=self.ingredients[0], amount=1)
+        self.client.force_login(admin)
+        url = '/admin/api/shoppinglistitem/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(f'{url}add/').status_code, 403)
+        self.assertEqual(self.client.post(
+            f'{url}{item.pk}/change/', {'amount': 5}).status_code, 403)
+        self.assertEqual(
+            self.client.post(f'{url}{item.pk}/delete/').status_code, 403)
+        item.refresh_from_db()
+        self.assertEqual(item.amount, 1)
+
+
+class RecipeSearchTests(FoodgramTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.soup = self.create_recipe(
+            self.clients[0], name='суп грибной', text='Сварить бульон.')
+        self.cake = self.create_recipe(
+            self.clients[0], name='Пирог', text='Добавить грибы и испечь.')
+        self.salad = self.create_recipe(
+            self.clients[0], name='Салат', text='Нарезать овощи.',
+            ingredient_count=3)
+
+    def search(self, term, **params):
+        response = self.anonymous.get('/api/recipes/',
+                                      dict(params, search=term))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def found(self, term):
+        return {recipe['id'] for recipe in self.search(term)['results']}
+
+    def test_name_text_and_ingredient_matches(self):
+        self.assertEqual(self.found('суп'), {self.soup.id})
+        self.assertEqual(self.found('бульон'), {self.soup.id})
+        self.assertEqual(self.found('молоко'), {self.salad.id})
+        self.assertEqual(self.found('гриб'), {self.soup.id, self.cake.id})
+        self.assertEqual(self.found('ананас'), set())
+
+    def test_cursor_keeps_search_order(self):
+        expected = list(search_recipes(Recipe.objects.all(), 'гриб')
+                        .values_list('id', flat=True))
+        data = self.search('гриб', cursor='', limit=1)
+        ids = [recipe['id'] for recipe in data['results']]
+        while data['next']:
+            data = self.anonymous.get(data['next']).json()
+            ids += [recipe['id'] for recipe in data['results']]
+        self.assertEqual(ids, expected)
+
+
+class DownloadShoppingCartTests(FoodgramTestCase):
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def download(self, file_format):
+        response = self.clients[1].get(self.url, {'format': file_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_cart.{file_format}"')
+        return response, b''.join(response.streaming_content).decode()
+
+    def add_to_cart(self):
+        recipe = self.create_recipe(self.clients[0], ingredient_count=3)
+        response = self.clients[1].post(
+            f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+
+    def test_txt(self):
+        self.add_to_cart()
+        response, content = self.download('txt')
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertEqual(content, 'Список покупок:\n'
+                                  'молоко: 12 мл\n'
+                                  'сахар: 11 г\n'
+                                  'соль: 10 г\n')
+
+    def test_csv(self):
+        self.add_to_cart()
+        response, content = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(content.splitlines(), [
+            'name,measurement_unit,amount',
+            'молоко,мл,12',
+            'сахар,г,11',
+            'соль,г,10',
+        ])
+
+    def test_json(self):
+        self.add_to_cart()
+        response, content = self.download('json')
+        self.assertEqual(response['Content-Type'],
+                         'application/json; charset=utf-8')
+        self.assertEqual(json.loads(content), [
+            {'name': 'молоко', 'measurement_unit': 'мл', 'amount': 12},
+            {'name': 'сахар', 'measurement_unit': 'г', 'amount': 11},
+            {'name': 'соль', 'measurement_unit': 'г', 'amount': 10},
+        ])
+
+    def test_txt_is_default(self):
+        response = self.clients[1].get(self.url)
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+
+    def test_empty_cart_json(self):
+        self.assertEqual(self.download('json')[1], '[]')
+
+    def test_unknown_format(self):
+        response = self.clients[1].get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+
+class LoadDataTests(FoodgramTestCase):
+
+    def write_file(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, path, *args):
+        stdout = io.StringIO()
+        call_command('load_data', path, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_json_is_streamed_across_chunks(self):
+        items = [{'name': f'продукт "{number}" [{number}]',
+                  'measurement_unit': 'г'}
+                 for number in range(50)]
+        content = json.dumps(items, ensure_ascii=False, indent=2)
+        for chunk_size in (1, 7, 64):
+            with self.subTest(chunk_size=chunk_size), mock.patch(
+                    'api.management.commands.load_data.READ_CHUNK_SIZE',
+                    chunk_size):
+                self.assertEqual(
+                    list(iter_json_array(io.StringIO(content))), items)
+
+        path = self.write_file('ingredients.json', content)
+        with mock.patch('api.management.commands.load_data.READ_CHUNK_SIZE',
+                        16):
+            output = self.load(path, '--batch-size', '7')
+        self.assertIn('Обработано строк: 50, добавлено: 50', output)
+        self.assertEqual(
+            Ingredient.objects.filter(name__startswith='продукт').count(), 50)
+
+    def test_rerun_inserts_nothing(self):
+        path = self.write_file(
+            'ingredients.csv', 'соль,г\nкорица,г\nваниль, г\n')
+        self.assertIn('Обработано строк: 3, добавлено: 2',
+                      self.load(path))
+        count = Ingredient.objects.count()
+        self.assertIn('Обработано строк: 3, добавлено: 0, пропущено: 3',
+                      self.load(path))
+        self.assertEqual(Ingredient.objects.count(), count)
+
+    def test_malformed_rows(self):
+        sources = {
+            'bad.csv': 'соль,г\nперец\n',
+            'bad.json': '[{"name": "соль", "measurement_unit": "г"}, '
+                        '{"name": "перец"}]',
+            'object.json': '{"name": "соль"}',
+            'truncated.json': '[{"name": "соль", "measurement_unit": ',
+        }
+        for name, content in sources.items():
+            with self.subTest(name=name):
+                with self.assertRaises(CommandError):
+                    self.load(self.write_file(name, content))
+        self.assertFalse(Ingredient.objects.filter(name='перец').exists())
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=0,
+                   SLOW_REQUEST_THRESHOLD_MS=60_000,
+                   SLOW_REQUEST_QUERY_THRESHOLD=1000)
+class RequestTimingMiddlewareTests(FoodgramTestCase):
+
+    url = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        self.users[0].is_staff = True
+        self.users[0].save()
+        self.create_recipe(self.clients[1])
+
+    def staff_client(self):
+        # Настройки читаются при создании middleware, то есть при первом
+        # запросе клиента.
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        return client
+
+    def query_count(self):
+        client = self.staff_client()
+        client.get(self.url)
+        header = client.get(self.url)['Server-Timing']
+        return int(re.search(r'desc="(\d+) queries"', header).group(1))
+
+    def test_server_timing_for_staff_only(self):
+        header = self.clients[0].get(self.url)['Server-Timing']
+        self.assertEqual(
+            [metric.split(';')[0] for metric in header.split(', ')],
+            ['db', 'view', 'render', 'total'])
+        self.assertNotIn('Server-Timing', self.clients[1].get(self.url))
+        self.assertNotIn('Server-Timing', self.anonymous.get(self.url))
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+    def test_sampled_requests_get_server_timing(self):
+        self.assertIn('Server-Timing', APIClient().get(self.url))
+
+    def test_slow_request_query_threshold(self):
+        count = self.query_count()
+        with override_settings(SLOW_REQUEST_QUERY_THRESHOLD=count):
+            with self.assertNoLogs('api.performance'):
+                self.staff_client().get(self.url)
+        with override_settings(SLOW_REQUEST_QUERY_THRESHOLD=count - 1):
+            with self.assertLogs('api.performance', 'WARNING') as logs:
+                self.staff_client().get(self.url)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f'Медленный запрос GET {self.url}', logs.output[0])
+        self.assertIn(f'SQL {count} запросов', logs.output[0])
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_time_threshold(self):
+        with self.assertLogs('api.performance', 'WARNING') as logs:
+            APIClient().get(self.url)
+        self.assertIn('статус 200', logs.output[0])
+
+
+class ShortLinkTests(FoodgramTestCase):
+
+    def test_unknown_code_is_cached_briefly(self):
+        self.assertEqual(self.anonymous.get('/s/nocode/').status_code, 404)
+        self.assertEqual(
+            cache.get(short_links.short_link_cache_key('nocode')),
+            short_links.MISSING)
+        with self.assertNumQueries(0):
+            self.assertIsNone(short_links.get_recipe_path('nocode'))
+        short_links._local.clear()
+        with self.assertNumQueries(0):
+            self.assertIsNone(short_links.get_recipe_path('nocode'))
+
+        recipe = self.create_recipe(self.clients[0])
+        Recipe.objects.filter(pk=recipe.pk).update(short_code='nocode')
+        cache.delete(short_links.short_link_cache_key('nocode'))
+        with mock.patch('api.short_links.time.monotonic',
+                        return_value=time.monotonic()
+                        + SHORT_LINK_NEGATIVE_TIMEOUT + 1):
+            self.assertEqual(short_links.get_recipe_path('nocode'),
+                             recipe.get_absolute_url())
+
+    def test_delete_invalidates_caches(self):
+        recipe = self.create_recipe(self.clients[0])
+        code = recipe.short_code
+        response = self.anonymous.get(f'/s/{code}/')
+        self.assertRedirects(response, recipe.get_absolute_url(),
+                             fetch_redirect_response=False)
+        self.assertEqual(short_links._local.get(code),
+                         (True, recipe.get_absolute_url()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertEqual(short_links._local.get(code), (False, None))
+        self.assertIsNone(cache.get(short_links.short_link_cache_key(code)))
+        self.assertEqual(self.anonymous.get(f'/s/{code}/').status_code, 404)
+
+    def test_short_code_collision_is_retried(self):
+        taken = self.create_recipe(self.clients[0]).short_code
+        with mock.patch.object(Recipe, 'generate_short_code',
+                               side_effect=[taken, 'fresh001']):
+            recipe = self.create_recipe(self.clients[0])
+        self.assertEqual(recipe.short_code, 'fresh001')
+
+        with mock.patch.object(Recipe, 'generate_short_code',
+                               return_value=taken), \
+                self.assertRaises(IntegrityError):
+            Recipe.objects.create(
+                author=self.users[0], name='Рецепт', text='Описание',
+                cooking_time=1, image='recipes/images/1.png')
+
+
+class SearchVectorBatchTests(FoodgramTestCase):
+
+    def test_updates_by_id_ranges(self):
+        recipes = [self.create_recipe(self.clients[0]) for _ in range(5)]
+        with mock.patch('api.search.search_is_supported',
+                        return_value=True), \
+                mock.patch('api.search.get_search_vector',
+                           return_value=Value(None)), \
+                CaptureQueriesContext(connection) as queries:
+            updated = update_search_vectors_in_batches(
+                Recipe.objects.filter(id__gte=recipes[1].id), batch_size=2)
+        self.assertEqual(updated, 4)
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertFalse(any(' IN (' in sql for sql in updates))
+
+
+class BenchmarkEndpointsTests(SimpleTestCase):
+
+    def test_failed_create_stops_with_response_body(self):
+        def request(method, path, data=None, token=None):
+            if (method, path) == ('POST', '/api/recipes/'):
+                return 400, b'{"image": ["bad"]}', 0.01, None, None
+            return 204, b'', 0.01, None, None
+
+        command = BenchmarkCommand()
+        command.options = {'iterations': 1, 'password': 'password',
+                           'email': 'user@example.com'}
+        command.samples = {}
+        command.token = 'token'
+        command.client = mock.Mock(request=request)
+        context = {'recipe': {'id': 1}, 'author': None,
+                   'ingredient': {'id': 1}, 'tag': {'id': 1}}
+        with self.assertRaisesRegex(CommandError, r'POST /api/recipes/.*'
+                                                  r'получен 400.*image'):
+            command.measure_scenarios(context)
+        self.assertEqual(command.samples['recipes-create']['statuses'],
+                         {400})
+
+
+class PaginationTests(FoodgramTestCase):
+
+    def paginate(self, queryset, query):
+        request = Request(APIRequestFactory().get('/api/recipes/', query))
+        paginator = CustomPageNumberPagination()
+        page = paginator.paginate_queryset(queryset, request)
+        return page, paginator.get_paginated_response([]).data
+
+    def test_cursor_uses_model_ordering(self):
+        page, data = self.paginate(Recipe.objects.all(), {'cursor': ''})
+        self.assertIn('next', data)
+        self.assertNotIn('count', data)
+
+    def test_ranked_queryset_keeps_its_ordering(self):
+        recipes = [self.create_recipe(self.clients[0], name=name)
+                   for name in ('Б', 'А', 'В')]
+        # Результаты поиска упорядочены по релевантности, а не по -id.
+        page, data = self.paginate(Recipe.objects.order_by('name'),
+                                   {'cursor': ''})
+        self.assertIn('count', data)
+        self.assertEqual([recipe.name for recipe in page],
+                         sorted(recipe.name for recipe in recipes))
+
+    def walk_cursor(self, client, url):
+        """
+        Проходит страницы курсора вперёд по next и обратно по previous
+        и возвращает id элементов страниц.
+        """
+        pages = []
+        while url:
+            data = client.get(url).json()
+            self.assertNotIn('count', data)
+            pages.append([item['id'] for item in data['results']])
+            url, previous = data['next'], data['previous']
+        backward = []
+        while previous:
+            data = client.get(previous).json()
+            self.assertNotIn('count', data)
+            backward.append([item['id'] for item in data['results']])
+            previous = data['previous']
+        self.assertEqual(backward, pages[-2::-1])
+        return pages
+
+    def test_recipes_cursor(self):
+        recipes = [self.create_recipe(self.clients[0], name=f'Рецепт {n}')
+                   for n in range(5)]
+        pages = self.walk_cursor(self.anonymous,
+                                 '/api/recipes/?cursor=&limit=2')
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []),
+                         [recipe.id for recipe in reversed(recipes)])
+
+    def test_subscriptions_cursor(self):
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password-12345')
+            for number in range(4)
+        ] + self.users[1:]
+        self.users[0].subscribed_to.add(*authors)
+        pages = self.walk_cursor(
+            self.clients[0], '/api/users/subscriptions/?cursor=&limit=4')
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        self.assertEqual(sum(pages, []),
+                         sorted(author.id for author in authors))
@@ -0,0 +1,134 @@
+import base64
+import binascii
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .constants import (IMAGE_MAX_DECODED_PIXELS, IMAGE_MAX_DIMENSION,
+                        IMAGE_MAX_PIXELS, IMAGE_UPLOAD_FORMATS,
+                        IMAGE_UPLOAD_MAX_SIZE)
+
+BASE64_MARKER = ';base64,'
+# Размер порции base64-строки, декодируемой за раз (кратен 4).
+BASE64_CHUNK_SIZE = 256 * 1024
+WHITESPACE = str.maketrans('', '', ' \t\r\n')
+RESIZED_JPEG_QUALITY = 90
+JPEG_DRAFT_RATIO = 0.5
+
+
+class ImageUploadError(ValueError):
+    """
+    Загруженные данные не являются допустимым изображением.
+    """
+
+
+def spooled_file(name, content_type):
+    """
+    Возвращает временный файл, который, как и загрузки Django,
+    хранится в памяти до FILE_UPLOAD_MAX_MEMORY_SIZE байт,
+    а затем на диске.
+    """
+    file = File(tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR), name=name)
+    file.content_type = content_type
+    return file
+
+
+def decode_base64_image(data, max_size=IMAGE_UPLOAD_MAX_SIZE):
+    """
+    Декодирует строку data:image/<формат>;base64,<данные> порциями
+    во временный файл, не создавая в памяти копию всего изображения.
+    """
+    offset = data.find(BASE64_MARKER)
+    if not data.startswith('data:image/') or offset == -1:
+        raise ImageUploadError('Неверный формат изображения.')
+    content_type = data[len('data:'):offset]
+    offset += len(BASE64_MARKER)
+    if (len(data) - offset) // 4 * 3 > max_size:
+        raise ImageUploadError(
+            f'Размер изображения превышает {max_size // 1024 // 1024} МБ.')
+
+    file = spooled_file('image', content_type)
+    pending = ''
+    try:
+        for start in range(offset, len(data), BASE64_CHUNK_SIZE):
+            chunk = pending + data[
+                start:start + BASE64_CHUNK_SIZE].translate(WHITESPACE)
+            usable = len(chunk) - len(chunk) % 4
+            file.write(base64.b64decode(chunk[:usable], validate=True))
+            pending = chunk[usable:]
+        if pending:
+            raise ImageUploadError('Неверный формат изображения.')
+    except (binascii.Error, ImageUploadError):
+        file.close()
+        raise ImageUploadError('Неверный формат изображения.')
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+def prepare_image(file, max_dimension=IMAGE_MAX_DIMENSION):
+    """
+    Проверяет формат и размеры изображения по заголовку файла, не
+    декодируя пиксели, и целостность файла (Image.verify). Предел
+    числа пикселей для форматов, которые декодируются целиком, ниже,
+    чем для JPEG.
+    Изображение больше max_dimension по любой стороне уменьшается
+    и сохраняется в новый временный файл. Возвращает файл с именем
+    и content_type, соответствующими формату.
+    """
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except (UnidentifiedImageError, OSError):
+        raise ImageUploadError(
+            'Загрузите корректное изображение. Файл повреждён '
+            'или не является изображением.')
+    extension = IMAGE_UPLOAD_FORMATS.get(image.format)
+    if extension is None:
+        raise ImageUploadError(
+            f'Формат {image.format} не поддерживается. Допустимые форматы: '
+            f'{", ".join(IMAGE_UPLOAD_FORMATS)}.')
+    width, height = image.size
+    max_pixels = (IMAGE_MAX_PIXELS if image.format == 'JPEG'
+                  else IMAGE_MAX_DECODED_PIXELS)
+    if width * height > max_pixels:
+        raise ImageUploadError(
+            f'Изображение {width}x{height} слишком большое: допустимо '
+            f'до {max_pixels / 1_000_000:.1f} млн пикселей для формата '
+            f'{image.format}.')
+    image_format = image.format
+    file.name = f'image.{extension}'
+    file.content_type = Image.MIME[image_format]
+    if max(width, height) <= max_dimension:
+        try:
+            image.verify()
+        except Exception:
+            raise ImageUploadError('Файл изображения повреждён.')
+        file.seek(0)
+        return file
+
+    # Для JPEG декодер сразу уменьшает изображение в 2-8 раз, если
+    # результат не меньше запрошенного размера. Запрашивается половина
+    # итогового размера (JPEG_DRAFT_RATIO) плюс пиксель: картинка может
+    # получиться меньше max_dimension (но не меньше половины), зато,
+    # как и для остальных форматов, в память декодируется не больше
+    # max_dimension ** 2 пикселей.
+    ratio = max_dimension / max(width, height) * JPEG_DRAFT_RATIO
+    image.draft('RGB', (int(width * ratio) + 1, int(height * ratio) + 1))
+    ImageOps.exif_transpose(image, in_place=True)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    options = {}
+    if image_format == 'JPEG':
+        options = {'quality': RESIZED_JPEG_QUALITY, 'optimize': True}
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+    resized = spooled_file(file.name, file.content_type)
+    image.save(resized, image_format, **options)
+    resized.size = resized.tell()
+    resized.seek(0)
+    file.close()
+    return resized
@@ -2,8 +2,8 @@ from django.urls import include, path
 from djoser.views import TokenCreateView, TokenDestroyView
 from rest_framework.routers import DefaultRouter
 
-from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                    TagViewSet)
+from .views import (CustomUserViewSet, IngredientViewSet, QueryStatsView,
+                    RecipeViewSet, TagViewSet)
 
 router = DefaultRouter()
 router.register('tags', TagViewSet, basename='tags')
@@ -43,4 +43,6 @@ urlpatterns = [
     path('users/set_password/',
          CustomUserViewSet.as_view({'post': 'set_password'}),
          name='set_password'),
+    # Статистика SQL-запросов для сотрудников
+    path('query-stats/', QueryStatsView.as_view(), name='query-stats'),
 ]
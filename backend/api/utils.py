@@ -1,11 +1,27 @@
-from django.shortcuts import get_object_or_404, redirect
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
 
-from .models import Recipe
+from .metrics import CONTENT_TYPE, metrics
+from .short_links import get_recipe_path
 
 
 def redirect_to_recipe(request, short_code):
     """
     Перенаправляет пользователя на страницу рецепта по короткому коду.
+    Путь рецепта берётся из кэша коротких ссылок.
     """
-    recipe = get_object_or_404(Recipe, short_code=short_code)
-    return redirect(recipe.get_absolute_url())
+    path = get_recipe_path(short_code)
+    if path is None:
+        raise Http404
+    return redirect(path)
+
+
+def metrics_view(request):
+    """
+    Отдаёт метрики всех воркеров в текстовом формате Prometheus.
+    nginx не проксирует этот адрес, он доступен только изнутри сети.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=CONTENT_TYPE)
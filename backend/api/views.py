@@ -1,17 +1,33 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import FormParser, JSONParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from . import shopping_list
+from .constants import INGREDIENTS_VERSION, TAGS_VERSION
 from .filters import IngredientFilter, RecipeFilter
-from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .ingredient_index import get_ingredient_index
+from .mixins import ReferenceDataMixin
+from .models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                     ShoppingListItem, Tag)
 from .paginators import CustomPageNumberPagination
+from .parsers import MultiPartJSONParser
 from .permissions import IsAuthorOrAdmin
+from .query_stats import SORT_FIELDS, query_stats
+from .renderers import CSVRenderer, PlainTextRenderer
+from .representations import RECIPE_ROW_FIELDS, render_recipes
 from .serializers import (AvatarSerializer, CreateRecipeSerializer,
                           CustomUserCreateSerializer, CustomUserSerializer,
                           IngredientGETSerializer, RecipeOutputSerializer,
@@ -29,6 +45,7 @@ class CustomUserViewSet(UserViewSet):
 
     serializer_class = CustomUserSerializer
     pagination_class = CustomPageNumberPagination
+    parser_classes = [JSONParser, FormParser, MultiPartJSONParser]
 
     def get_queryset(self):
         """
@@ -79,20 +96,63 @@ class CustomUserViewSet(UserViewSet):
                 {'avatar': full_avatar_url},
                 status=status.HTTP_200_OK)
         elif request.method == 'DELETE':
-            user.avatar.delete(save=True)
             user.avatar = None
             user.save()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_recipes_limit(self, request):
+        """
+        Возвращает значение параметра recipes_limit или None.
+        Вызывает ValueError, если значение не является целым числом >= 0.
+        """
+        recipes_limit = request.query_params.get('recipes_limit', None)
+        if recipes_limit is None:
+            return None
+        recipes_limit = int(recipes_limit)
+        if recipes_limit < 0:
+            raise ValueError
+        return recipes_limit
+
+    def attach_recipes(self, authors, recipes_limit):
+        """
+        Загружает одним запросом первые recipes_limit рецептов каждого
+        автора (коррелированный подзапрос с LIMIT по автору) и сохраняет
+        их в атрибут limited_recipes.
+        """
+        if not authors:
+            return
+        recipes = Recipe.objects.filter(
+            author_id__in=[author.id for author in authors]).only(
+                'id', 'author_id', 'name', 'image', 'cooking_time'
+        ).order_by('author_id', '-id')
+        if recipes_limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(author_id=OuterRef('author_id'))
+                .order_by('-id').values('id')[:recipes_limit]))
+
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.limited_recipes = recipes_by_author[author.id]
+
     def subscriptions(self, request, *args, **kwargs):
         """
         Возвращает список подписок текущего пользователя.
+        Количество рецептов вычисляется аннотацией, а рецепты
+        с учётом recipes_limit загружаются одним запросом на страницу.
         """
-        subscribed_users = (request.user.subscribed_to
-                            .prefetch_related('recipes')
-                            .all())
+        try:
+            recipes_limit = self.get_recipes_limit(request)
+        except ValueError:
+            return Response(
+                {'error': 'recipes_limit должно быть целым числом.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        subscribed_users = request.user.subscribed_to.annotate(
+            recipes_count=Count('recipes')).order_by('id')
         paginator = self.pagination_class()
         page = paginator.paginate_queryset(subscribed_users, request)
+        self.attach_recipes(page, recipes_limit)
         serializer = SubscriptionsSerializer(
             page,
             many=True,
@@ -107,21 +167,17 @@ class CustomUserViewSet(UserViewSet):
         user_to_subscribe = self.get_object()
 
         if request.method == 'POST':
-            recipes_limit = request.query_params.get('recipes_limit', None)
-            if recipes_limit is not None:
-                try:
-                    recipes_limit = int(recipes_limit)
-                except ValueError:
-                    return Response(
-                        {'error': 'recipes_limit должно быть целым числом.'},
-                        status=status.HTTP_400_BAD_REQUEST)
-
-            recipes = user_to_subscribe.recipes.all()[:recipes_limit]
+            try:
+                recipes_limit = self.get_recipes_limit(request)
+            except ValueError:
+                return Response(
+                    {'error': 'recipes_limit должно быть целым числом.'},
+                    status=status.HTTP_400_BAD_REQUEST)
 
             serializer = SubscriptionsSerializer(
                 instance=user_to_subscribe,
                 context={
-                    'request': request, 'recipes': recipes})
+                    'request': request, 'recipes_limit': recipes_limit})
 
             serializer.save()
 
@@ -138,13 +194,14 @@ class CustomUserViewSet(UserViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceDataMixin, ReadOnlyModelViewSet):
     """
     ViewSet для получения списка тегов и тега.
     """
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    data_version_name = TAGS_VERSION
 
 
 class RecipeViewSet(ModelViewSet):
@@ -158,6 +215,35 @@ class RecipeViewSet(ModelViewSet):
     pagination_class = CustomPageNumberPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    parser_classes = [JSONParser, MultiPartJSONParser]
+
+    def get_queryset(self):
+        """
+        Возвращает queryset рецептов. Для чтения рецептов возвращаются
+        строки values() с id рецепта и автора, которые рендерит
+        render_recipes.
+        """
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            return queryset.values(*RECIPE_ROW_FIELDS)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        Возвращает список рецептов, собранный из строк values()
+        без создания объектов моделей и сериализаторов DRF.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(render_recipes(page, request))
+        return Response(render_recipes(list(queryset), request))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Возвращает рецепт, собранный из строки values().
+        """
+        return Response(render_recipes([self.get_object()], request)[0])
 
     def get_serializer_class(self):
         """
@@ -266,8 +352,11 @@ class RecipeViewSet(ModelViewSet):
         recipe = self.get_object()
         user = request.user
         if request.method == 'POST':
-            shopping_cart, created = ShoppingCart.objects.get_or_create(
-                user=user, recipe=recipe)
+            with transaction.atomic():
+                shopping_cart, created = ShoppingCart.objects.get_or_create(
+                    user=user, recipe=recipe)
+                if created:
+                    shopping_list.add_recipe(user.id, recipe.id)
             if not created:
                 return Response(
                     {'errors': 'Рецепт уже находится в списке покупок'},
@@ -277,45 +366,47 @@ class RecipeViewSet(ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
             try:
-                shopping_cart = ShoppingCart.objects.get(
-                    user=user, recipe=recipe)
-                shopping_cart.delete()
+                with transaction.atomic():
+                    shopping_cart = ShoppingCart.objects.get(
+                        user=user, recipe=recipe)
+                    shopping_list.remove_recipe(user.id, recipe.id)
+                    shopping_cart.delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
             except ShoppingCart.DoesNotExist:
                 return Response(
                     {'errors': 'Рецепт не найден в списке покупок'},
                     status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['GET'], url_path='download_shopping_cart')
+    @action(detail=False, methods=['GET'], url_path='download_shopping_cart',
+            renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer])
     def download_shopping_cart(self, request):
         """
-        Генерирует и возвращает текстовый файл со списком покупок.
-        """
-        shopping_cart = request.user.shopping_cart.all()
-
-        ingredients = {}
-        for item in shopping_cart:
-            recipe = item.recipe
-            for recipe_ingredient in recipe.recipe_ingredients.all():
-                ingredient = recipe_ingredient.ingredient
-                amount = recipe_ingredient.amount
-                if ingredient.name in ingredients:
-                    ingredients[ingredient.name] += amount
-                else:
-                    ingredients[ingredient.name] = amount
-
-        content = 'Список покупок:\n'
-        for name, amount in ingredients.items():
-            content += f'{name}: {amount} {ingredient.measurement_unit}\n'
-
-        response = HttpResponse(content, content_type='text/plain')
-        conf = 'attachment; filename="shopping_cart.txt"'
-        response['Content-Disposition'] = conf
-
+        Генерирует и отдаёт потоком файл со списком покупок.
+        Количества уже просуммированы в ShoppingListItem, поэтому файл
+        строится одним чтением по индексу пользователя. Формат выбирается
+        параметром ?format=txt|csv|json, по умолчанию txt.
+        """
+        ingredients = (
+            ShoppingListItem.objects
+            .filter(user=request.user)
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
+            .values_list('ingredient__name', 'ingredient__measurement_unit',
+                         'amount')
+            .iterator()
+        )
+        renderer = request.accepted_renderer
+        file_format = renderer.format
+        content = shopping_list.SHOPPING_LIST_WRITERS[file_format](
+            ingredients)
+        response = StreamingHttpResponse(
+            content,
+            content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"')
         return response
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, ReadOnlyModelViewSet):
     """
     ViewSet для получения списка ингредиентов и ингредиента.
     """
@@ -324,3 +415,44 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     serializer_class = IngredientGETSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    data_version_name = INGREDIENTS_VERSION
+
+    def get_reference_items(self):
+        return get_ingredient_index().items
+
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по названию (?name=) выполняется по индексу в памяти
+        процесса: сначала совпадения по началу названия, затем по
+        вхождению. Нечёткий поиск (?search=) выполняется в БД.
+        """
+        name = request.query_params.get('name')
+        if not name or 'search' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return Response(get_ingredient_index().search(name))
+
+
+class QueryStatsView(APIView):
+    """
+    Статистика SQL-запросов по отпечаткам для сотрудников.
+    Параметры: limit, sort (total, count, max, mean), view и
+    group=fingerprint для суммирования по всем представлениям.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        sort = request.query_params.get('sort', 'total')
+        if sort not in SORT_FIELDS:
+            return Response(
+                {'sort': f'Допустимые значения: {", ".join(SORT_FIELDS)}.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'limit': 'Ожидается целое число.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(query_stats.top(
+            limit=limit, sort=sort,
+            view=request.query_params.get('view'),
+            by_view=request.query_params.get('group') != 'fingerprint'))
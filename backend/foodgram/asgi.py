@@ -11,6 +11,10 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from api.snapshots import mark_server_process
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_asgi_application()
+
+mark_server_process()
@@ -3,12 +3,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
-from api.utils import redirect_to_recipe
+from api.utils import metrics_view, redirect_to_recipe
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('s/<str:short_code>/', redirect_to_recipe, name='recipe'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 
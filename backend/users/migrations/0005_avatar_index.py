@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:43
+
+from django.db import migrations, models
+import users.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='avatar',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to=users.utils.user_directory_path),
+        ),
+    ]
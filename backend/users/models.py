@@ -6,7 +6,9 @@ from .utils import user_directory_path
 
 class CustomUser(AbstractUser):
     avatar = models.ImageField(
-        upload_to=user_directory_path, null=True, blank=True)
+        upload_to=user_directory_path, null=True, blank=True, db_index=True)
+    avatar_variants = models.JSONField(
+        'Варианты аватара', default=dict, blank=True, editable=False)
     subscribers = models.ManyToManyField(
         'self',
         related_name='subscribed_to',